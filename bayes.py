@@ -0,0 +1,77 @@
+import numpy as np
+
+import checkpoint
+
+
+ANY = 2  # index of said and changed summing over both values
+
+
+class CardCounts(object):
+    """
+    Counts of finished rounds as a 2x2x2x2 array indexed by
+    (my card, card the opponent said last, opponent changed, opponent card), cards as 0 for red and 1 for black.
+    The counts summed over said and changed (index ANY) and over the opponent card are kept next to them,
+    so the posterior P(opponent card | my card, said, changed) is a handful of reads.
+    """
+    def __init__(self, apriori: int = 10, counts: np.ndarray = None):
+        self.counts = np.full((2, 2, 2, 2), apriori, dtype=np.int64) if counts is None else counts
+        extended = np.zeros((2, 3, 3, 2), dtype=np.int64)
+        extended[:, :2, :2, :] = self.counts
+        extended[:, ANY, :2, :] = self.counts.sum(axis=1)
+        extended[:, :2, ANY, :] = self.counts.sum(axis=2)
+        extended[:, ANY, ANY, :] = self.counts.sum(axis=(1, 2))
+        # nested lists as reading them is faster than indexing numpy scalars
+        self._extended = extended.tolist()
+        self._opponent_cards = self.counts.sum(axis=(0, 1, 2)).tolist()
+        self.rounds = int(self.counts.sum())
+
+    def save(self, path: str) -> None:
+        checkpoint.save(path, "CardCounts", {"counts": self.counts})
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = False) -> "CardCounts":
+        return cls(counts=checkpoint.load(path, "CardCounts", mmap).arrays["counts"])
+
+    def add(self, my_card: int, said: int, changed: int, opponent_card: int) -> None:
+        # numpy would take a bool changed for a mask
+        my_card, said, changed, opponent_card = int(my_card), int(said), int(changed), int(opponent_card)
+        self.counts[my_card, said, changed, opponent_card] += 1
+        extended = self._extended[my_card]
+        for s in (said, ANY):
+            for c in (changed, ANY):
+                extended[s][c][opponent_card] += 1
+        self._opponent_cards[opponent_card] += 1
+        self.rounds += 1
+
+    def add_batch(self, my_cards, said, changed, opponent_cards) -> None:
+        """
+        add of many rounds at once, arguments are arrays of indexes
+        """
+        my_cards, said, changed, opponent_cards = (np.asarray(a, dtype=np.int64)
+                                                   for a in (my_cards, said, changed, opponent_cards))
+        np.add.at(self.counts, (my_cards, said, changed, opponent_cards), 1)
+        extended = np.array(self._extended, dtype=np.int64)
+        for s in (said, ANY):
+            for c in (changed, ANY):
+                np.add.at(extended, (my_cards, s, c, opponent_cards), 1)
+        self._extended = extended.tolist()
+        for opponent_card, count in enumerate(np.bincount(opponent_cards, minlength=2).tolist()):
+            self._opponent_cards[opponent_card] += count
+        self.rounds += len(opponent_cards)
+
+    @property
+    def posterior(self) -> np.ndarray:
+        """
+        probability of every (my card, said, changed, opponent card), said and changed including ANY
+        """
+        extended = np.array(self._extended, dtype=np.int64)
+        return 0.5 * (extended / np.array(self._opponent_cards)) / (extended.sum(axis=3, keepdims=True) / self.rounds)
+
+    def probability(self, my_card: int, said: int, changed: int, opponent_card: int) -> float:
+        """
+        0.5 * P(my card, said, changed | opponent card) / P(my card, said, changed),
+        said and changed may be ANY when unknown
+        """
+        counts = self._extended[my_card][said][changed]
+        return 0.5 * (counts[opponent_card] / self._opponent_cards[opponent_card]) / \
+            ((counts[0] + counts[1]) / self.rounds)
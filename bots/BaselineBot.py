@@ -1,9 +1,16 @@
 from .Bot import Bot
+from env import Card
 
 
 class BaselineBot(Bot):
     def _act(self) -> object:
-        return self.env.action_space.sample()
+        return self._random.choice((Card.RED, Card.BLACK))
 
     def _observe(self) -> None:
         pass
+
+    def act_batch(self, observations, tables=None):
+        return self._np_random.randint(2, size=len(observations))
+
+    def observe_batch(self, observations, rewards, dones, tables=None) -> None:
+        pass
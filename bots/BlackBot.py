@@ -1,3 +1,5 @@
+import numpy as np
+
 from .Bot import Bot
 from env import Card
 
@@ -9,3 +11,9 @@ class BlackBot(Bot):
 
     def _observe(self) -> None:
         pass
+
+    def act_batch(self, observations, tables=None):
+        return np.full(len(observations), Card.BLACK, dtype=np.int8)
+
+    def observe_batch(self, observations, rewards, dones, tables=None) -> None:
+        pass
@@ -1,6 +1,15 @@
+import random
+import time
 from abc import ABCMeta, abstractmethod
+from collections import namedtuple
 from gym import Env
 
+from seeding import np_random
+
+
+RunResult = namedtuple("RunResult",
+                       "episodes steps total_reward wins steps_per_second episode_lengths episode_rewards")
+
 
 class Bot(object):
     __metaclass__ = ABCMeta
@@ -17,6 +26,15 @@ class Bot(object):
         self.info = {}
         self.action = None
         self.debug = debug
+        self._random = random.Random()
+        self._np_random = np_random()
+
+    def seed(self, seed: int = None) -> None:
+        """
+        The bot draws from its own streams only, so bots and envs seeded apart do not interfere
+        """
+        self._random = random.Random(seed)
+        self._np_random = np_random(seed)
 
     def set_env(self, env: Env) -> None:
         self.env = env
@@ -46,18 +64,77 @@ class Bot(object):
         self.action = self._act()
         return self.action
 
-    def run(self, episodes: int = 1000) -> None:
-        for i_episode in range(episodes):
-            counter = 0
-            initial_state = self.env.reset()
-            self.observe(*initial_state)
+    def _take(self, action: object) -> None:
+        """
+        What _act records besides choosing, for an action chosen elsewhere.
+        Bots that learn only in _observe keep nothing.
+        """
+        pass
+
+    def take(self, action: object) -> object:
+        """
+        Goes on as if act() had returned action, e.g. to learn from recorded play
+        """
+        self._take(action)
+        self.action = action
+        return self.action
+
+    def observe_batch(self, observations, rewards, dones, tables=None) -> None:
+        """
+        Batched observe for VectorCardsGuessing, rows of observations belong to the given tables
+        """
+        raise NotImplementedError()
+
+    def act_batch(self, observations, tables=None):
+        """
+        Batched act for VectorCardsGuessing, returns one action per row of observations
+        """
+        raise NotImplementedError()
+
+    def _run_episode(self, i_episode: int, render: bool) -> (int, float):
+        counter = 0
+        episode_reward = 0.0
+        initial_state = self.env.reset()
+        self.observe(*initial_state)
+        if render:
             self.env.render(mode='ansi')
-            while True:
-                counter += 1
-                action = self.act()
-                state = self.env.step(action)
-                self.observe(*state)
+        while True:
+            counter += 1
+            action = self.act()
+            state = self.env.step(action)
+            self.observe(*state)
+            episode_reward += self.reward
+            if render:
                 self.env.render(mode='ansi')
-                if self.done:
+            if self.done:
+                if render:
                     print(f"Episode { i_episode } finished after { counter } timesteps")
-                    break
+                return counter, episode_reward
+
+    def run(self, episodes: int = 1000, render: bool = True, render_every: int = None) -> RunResult:
+        """
+        Plays episodes against the env. With render=False nothing is rendered or printed
+        except every render_every-th episode, if given. An episode is won when it brought a positive reward:
+        the opponent ran out of money, or the bot is ahead when a time limit ends the episode.
+        """
+        episode_lengths = []
+        episode_rewards = []
+        total_reward = 0.0
+        wins = 0
+        start = time.perf_counter()
+        for i_episode in range(episodes):
+            render_episode = render or (render_every is not None and i_episode % render_every == 0)
+            counter, episode_reward = self._run_episode(i_episode, render_episode)
+            episode_lengths.append(counter)
+            episode_rewards.append(episode_reward)
+            total_reward += episode_reward
+            wins += episode_reward > 0
+        elapsed = time.perf_counter() - start
+        steps = sum(episode_lengths)
+        return RunResult(episodes=episodes,
+                         steps=steps,
+                         total_reward=total_reward,
+                         wins=wins,
+                         steps_per_second=steps / elapsed if elapsed > 0 else float("inf"),
+                         episode_lengths=episode_lengths,
+                         episode_rewards=episode_rewards)
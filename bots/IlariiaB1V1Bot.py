@@ -1,3 +1,5 @@
+import numpy as np
+
 from env import switch_card, Guess
 from .Bot import Bot
 
@@ -11,3 +13,10 @@ class IlariiaB1V1Bot(Bot):
 
     def _observe(self):
         pass
+
+    def act_batch(self, observations, tables=None):
+        said = observations[:, 2]
+        return 1 - np.where(said == Guess.AWAITING_FOR_GUESS, observations[:, 1], said)
+
+    def observe_batch(self, observations, rewards, dones, tables=None) -> None:
+        pass
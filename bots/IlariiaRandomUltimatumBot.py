@@ -4,4 +4,4 @@ from .IlariiaUltimatumBot import IlariiaUltimatumBot
 
 class IlariiaRandomUltimatumBot(IlariiaUltimatumBot):
     def _basic_strategy(self) -> Card:
-        return self.env.action_space.sample()
+        return self._random.choice((Card.RED, Card.BLACK))
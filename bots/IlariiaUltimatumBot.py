@@ -1,32 +1,45 @@
 from env import switch_card, Guess, Card, FirstTurnInRound
+import checkpoint
+from trie import PrefixTrie
 from .Bot import Bot
 from itertools import zip_longest
 
 
-def _list_sequence(list1, list2):
-    sequence = []
-    for event1, event2 in zip_longest(list1, list2):
-        sequence.append(event1)
-        sequence.append(event2)
-    return sequence
+_SYMBOLS = (None, Guess.RED, Guess.BLACK, Guess.AWAITING_FOR_GUESS)  # Card values are equal to the Guess ones
 
 
 class IlariiaUltimatumBot(Bot):
 
-    def __init__(self, learning_time: int, debug: bool = False):
+    def __init__(self, learning_time: int, debug: bool = False, max_nodes: int = None, decay: float = 1.0):
+        """
+        max_nodes bounds the memory of the historic base and decay < 1 forgets old rounds, see PrefixTrie
+        """
         super(IlariiaUltimatumBot, self).__init__(debug)
         self.counter = 0
         self.learning_time = learning_time
-        self.historic_base = {}
+        self.historic_base = PrefixTrie(max_nodes, decay)
 
         self.my_card = None
         self.my = []
         self.opponent = []
+        # the moves of a round are looked up after the last said guess, the walk of the round
+        # is kept for every possible guess as the historic base does not change during a round
+        self._nodes = {}
 
     def _reset(self) -> None:
         self.my_card = None
         self.my = []
         self.opponent = []
+        self._nodes = {guess: self.historic_base.child(PrefixTrie.ROOT, guess) for guess in Guess}
+
+    def save(self, path: str) -> None:
+        self.historic_base.save(path, _SYMBOLS, counter=self.counter)
+
+    def load(self, path: str) -> None:
+        saved = checkpoint.load(path, "PrefixTrie")
+        self.historic_base = PrefixTrie.from_checkpoint(saved, _SYMBOLS)
+        self.counter = saved.attributes["counter"]
+        self._nodes = {}
 
     def _basic_strategy(self) -> int:
         if self.observation[2] == Guess.AWAITING_FOR_GUESS:
@@ -34,16 +47,10 @@ class IlariiaUltimatumBot(Bot):
         return switch_card(self.observation[2])
 
     def _historic_base_strategy(self) -> int:
+        base = self.historic_base
+        node = self._nodes[self.observation[2]]
 
-        sequence = _list_sequence(self.my, self.opponent)
-
-        choose_red = tuple([self.observation[2]] + sequence + [Card.RED])
-        choose_black = tuple([self.observation[2]] + sequence + [Card.BLACK])
-
-        m_red, c_red = self.historic_base.get(choose_red, (0, 1))
-        m_black, c_black = self.historic_base.get(choose_black, (0, 1))
-
-        if m_red / c_red > m_black/c_black:
+        if base.mean(base.child(node, Card.RED)) > base.mean(base.child(node, Card.BLACK)):
             return Card.RED
         else:
             return Card.BLACK
@@ -57,17 +64,22 @@ class IlariiaUltimatumBot(Bot):
 
     def _observe(self) -> None:
         if self.observation[0] == FirstTurnInRound.YES:
-            sequence = _list_sequence(self.my, self.opponent)
-            i = 0
-            while i < len(sequence):
-                key = tuple([self.my_card] + sequence[: (i + 1)])
-                if key not in self.historic_base:
-                    new_value = (self.reward, 1)
-                else:
-                    new_value = (self.historic_base[key][0] + self.reward, self.historic_base[key][1] + 1)
-                self.historic_base[key] = new_value
-                i += 2
+            # every prefix of the round ending with my move is counted, one node per move
+            base = self.historic_base
+            if self.opponent:
+                node = base.add_child(base.ROOT, self.my_card)
+                for i, (my, opponent) in enumerate(zip_longest(self.my, self.opponent)):
+                    if i:
+                        node = base.add_child(node, previous)
+                    node = base.add_child(node, my)
+                    base.add(node, self.reward)
+                    previous = opponent
+            base.tick()
+            self._reset()
+        elif not self._nodes:
             self._reset()
         self.my_card = self.observation[1]
         self.opponent.append(self.observation[2])
-
+        # self.my stays empty, so every opponent guess follows a None in the sequence
+        for guess, node in self._nodes.items():
+            self._nodes[guess] = self.historic_base.child(self.historic_base.child(node, None), self.observation[2])
@@ -1,12 +1,15 @@
 from collections import namedtuple
-import random
 from itertools import product
 
+import numpy as np
+
+from bayes import ANY, CardCounts
 from env import switch_card, Card, FirstTurnInRound, Guess
 from .Bot import Bot
 
 
 RoundHistory = namedtuple("RoundHistory", "my_card opp_said_card changed opp_card")
+_CARDS = (Card.RED, Card.BLACK)
 
 
 class MishaBotV1New(Bot):
@@ -15,8 +18,7 @@ class MishaBotV1New(Bot):
         super(MishaBotV1New, self).__init__(debug)
         self._apriori = apriori
         # Storage
-        self.marginal_counters = self._init_counters(apriori)
-        self._number_of_rounds = len(self.marginal_counters) * apriori
+        self.counts = CardCounts(apriori)
 
         # Round state
         self._my_card = None
@@ -24,13 +26,19 @@ class MishaBotV1New(Bot):
         self._op_previous_guess = None
         self._op_changed_guess = None
 
+        # Round state of VectorCardsGuessing tables, -1 for None
+        self._tables_my_card = None
+        self._tables_previous_guess = None
+        self._tables_changed = None
+        self._tables_action = None
+
     def _observe(self) -> None:
         if self._my_card is not None and self.observation[0] == FirstTurnInRound.YES and self._op_previous_guess is not None:
-            changed = False if self._op_changed_guess is None else self._op_changed_guess
-            opponent_card = Card(self.observation[3])
-            history = RoundHistory(self._my_card, self._op_previous_guess, changed, opponent_card)
-            self.marginal_counters[history] += 1
-            self._number_of_rounds += 1
+            # opponent's card is unknown when a new episode interrupted the round
+            if self.observation[3] != Guess.AWAITING_FOR_GUESS:
+                changed = False if self._op_changed_guess is None else self._op_changed_guess
+                opponent_card = Card(self.observation[3])
+                self.counts.add(self._my_card, self._op_previous_guess, changed, opponent_card)
             self._reset()
 
         if self.observation[2] != Guess.AWAITING_FOR_GUESS:
@@ -44,9 +52,10 @@ class MishaBotV1New(Bot):
         self._prev_reward = self.reward
 
     def _act(self) -> object:
-        if self.observation[0] == FirstTurnInRound.YES:
+        # as an opponent the very first move may come without FirstTurnInRound.YES
+        if self.observation[0] == FirstTurnInRound.YES or self.action is None:
             if self.observation[2] == Guess.AWAITING_FOR_GUESS:
-                return random.choice([Card.BLACK, Card.RED])
+                return self._random.choice([Card.BLACK, Card.RED])
             else:
                 red_prob = self._p_opcard_cond_all(Card.RED)
                 if red_prob > 0.5:
@@ -65,42 +74,82 @@ class MishaBotV1New(Bot):
                 else:
                     return self.action
 
-    @staticmethod
-    def _init_counters(apriori):
-        mycard = [Card.RED, Card.BLACK]
-        opsaid = [Card.RED, Card.BLACK]
-        changed = [True, False]
-        opcard = [Card.RED, Card.BLACK]
-        return {RoundHistory(*i): apriori for i in product(mycard, opsaid, changed, opcard)}
+    def _init_tables(self, num_envs: int) -> None:
+        self._tables_my_card = np.full(num_envs, -1, dtype=np.int8)
+        self._tables_previous_guess = np.full(num_envs, -1, dtype=np.int8)
+        self._tables_changed = np.full(num_envs, ANY, dtype=np.int8)
+        self._tables_action = np.full(num_envs, -1, dtype=np.int8)
+
+    def observe_batch(self, observations, rewards, dones, tables=None) -> None:
+        """
+        _observe of every table at once, the rounds finished in the batch are counted together
+        """
+        if self._tables_my_card is None:
+            self._init_tables(self.env.num_envs)
+        if tables is None:
+            tables = np.arange(len(observations))
+        my_card = self._tables_my_card[tables]
+        previous_guess = self._tables_previous_guess[tables]
+        changed = self._tables_changed[tables]
+
+        finished = (my_card >= 0) & (observations[:, 0] == FirstTurnInRound.YES) & (previous_guess >= 0)
+        known = finished & (observations[:, 3] != Guess.AWAITING_FOR_GUESS)
+        if known.any():
+            self.counts.add_batch(my_card[known], previous_guess[known],
+                                  np.where(changed[known] == ANY, 0, changed[known]), observations[known, 3])
+        previous_guess[finished] = -1
+        changed[finished] = 0
+
+        said = observations[:, 2]
+        guessed = said != Guess.AWAITING_FOR_GUESS
+        changed[guessed & (previous_guess >= 0) & (previous_guess != said)] = 1
+        previous_guess[guessed] = said[guessed]
+
+        self._tables_my_card[tables] = observations[:, 1]
+        self._tables_previous_guess[tables] = previous_guess
+        self._tables_changed[tables] = changed
+
+    def act_batch(self, observations, tables=None):
+        """
+        _act of every table at once, the posteriors of all tables are one lookup into CardCounts.posterior
+        """
+        if self._tables_my_card is None:
+            self._init_tables(self.env.num_envs)
+        if tables is None:
+            tables = np.arange(len(observations))
+        my_card = observations[:, 1]
+        said = observations[:, 2]
+        changed = self._tables_changed[tables]
+        action = self._tables_action[tables]
+        posterior = self.counts.posterior[my_card, said, changed]
+
+        first = (observations[:, 0] == FirstTurnInRound.YES) | (action < 0)
+        first_actions = np.where(posterior[:, Card.RED] > 0.5, Card.RED, Card.BLACK)
+        awaiting = first & (said == Guess.AWAITING_FOR_GUESS)
+        first_actions[awaiting] = self._np_random.randint(2, size=awaiting.sum())
+
+        rows = np.arange(len(observations))
+        current = np.maximum(action, 0)
+        switch = (said == my_card) & (posterior[rows, 1 - current] > posterior[rows, current])
+        actions = np.where(first, first_actions, np.where(switch, 1 - current, current)).astype(np.int8)
+        self._tables_action[tables] = actions
+        return actions
+
+    def save(self, path: str) -> None:
+        self.counts.save(path)
+
+    def load(self, path: str, mmap: bool = False) -> None:
+        self.counts = CardCounts.load(path, mmap)
+
+    @property
+    def marginal_counters(self):
+        return {RoundHistory(*history): int(self.counts.counts[tuple(map(int, history))])
+                for history in product(_CARDS, _CARDS, (True, False), _CARDS)}
 
     def _p_opcard_cond_all(self, opcard):
-        mycard = self.observation[1]
-        opsaid = self.observation[2]
-        changed = self._op_changed_guess
-        p_all_marg = self._marg_p(mycard=mycard, opsaid=opsaid, changed=changed)
-        p_all_cond_opcard = self._cond_p(opcard=opcard, mycard=mycard, opsaid=opsaid, changed=changed)
-        p_opcard_cond_all = 0.5 * p_all_cond_opcard / p_all_marg
-        return p_opcard_cond_all
-
-    def _marg_p(self, mycard=None, opsaid=None, changed=None, opcard=None):
-        mycard = [mycard]
-        opsaid = [Card.RED, Card.BLACK] if opsaid == Guess.AWAITING_FOR_GUESS else [opsaid]
-        changed = [True, False] if changed is None else [changed]
-        opcard = [Card.RED, Card.BLACK] if opcard is None else [opcard]
-        counter = sum(self.marginal_counters[RoundHistory(*i)] for i in product(mycard, opsaid, changed, opcard))
-        return counter / self._number_of_rounds
-
-    def _cond_p(self, opcard, mycard, opsaid=None, changed=None):
-        mycard = [mycard]
-        opsaid = [Card.RED, Card.BLACK] if opsaid == Guess.AWAITING_FOR_GUESS else [opsaid]
-        changed = [True, False] if changed is None else [changed]
-        total = sum(self.marginal_counters[RoundHistory(*i)] for i in product([Card.RED, Card.BLACK],
-                                                                              [Card.RED, Card.BLACK],
-                                                                              [True, False],
-                                                                              [opcard]))
-
-        count = sum(self.marginal_counters[RoundHistory(*i)] for i in product(mycard, opsaid, changed, [opcard]))
-        return count / total
+        # AWAITING_FOR_GUESS is the ANY index of the said card
+        changed = ANY if self._op_changed_guess is None else self._op_changed_guess
+        return self.counts.probability(self.observation[1], self.observation[2], changed, opcard)
 
     def _reset(self) -> None:
         self._op_previous_guess = None
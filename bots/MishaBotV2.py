@@ -1,4 +1,3 @@
-from random import random
 from env import switch_card, Guess, Card, FirstTurnInRound
 from .Bot import Bot
 
@@ -7,8 +6,8 @@ class MishaBotV2(Bot):
 
     def _act(self) -> object:
         if self.observation[2] == Guess.AWAITING_FOR_GUESS:
-            return random.choice([Card.BLACK, Card.RED])
-        elif self.observation[0] == FirstTurnInRound.YES:
+            return self._random.choice([Card.BLACK, Card.RED])
+        elif self.observation[0] == FirstTurnInRound.YES or self.action is None:
             return switch_card(self.observation[2])
         else:
             return self.action
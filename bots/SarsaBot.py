@@ -1,103 +1,180 @@
-import random
-from collections import Counter
+import numpy as np
 
 from .Bot import Bot
 from env import switch_card, FirstTurnInRound
+from qtable import QTable
 
 
 class State(object):
     """
-    Actual color of the card does not matter. So the state space can be reduced
+    Actual color of the card does not matter. So the state space can be reduced to the sequence of these events,
+    interned to ids by QTable
     """
     KEEP = 0
     CHANGE = 1
     OPPONENT_SAID_MY = 2
     OPPONENT_SAID_NOT_MY = 3
 
-    def __init__(self, prev_state=None):
-        """
-        We want to init from previous state to form trajectory
-        state_1 -> state_2 -> current_state
-        :param prev_state:
-        """
-        self._prev_state = prev_state
-        self.event_sequence = []
-        if prev_state:
-            self.event_sequence += prev_state.event_sequence
-
-    def make_tuple(self):
-        """
-        Used for hashing
-        :return:
-        """
-        return tuple(self.event_sequence)
-
-    def add_event(self, event):
-        self.event_sequence.append(event)
-
-    def get_prev(self):
-        """
-        Method aimed for backtracking update of action values
-        """
-        return self._prev_state
-
 
 class SarsaBot(Bot):
     def __init__(self, discount=0.9, alpha=0.1, explorer_spirit_level=0.05, debug=False):
         super(SarsaBot, self).__init__(debug)
-        self._q_table = Counter()   # table contains values for state - action pairs
+        self._q_table = QTable()   # table contains values for state - action pairs
         self._explorer_spirit = explorer_spirit_level  # chance of executing random policy
         self._discount = discount  # we favor quick winning to long one
         self._alpha = alpha  # value update rate
 
-        self._state = State()
+        self._state = QTable.ROOT
+        self._states = []  # states the actions of the round were taken in
         self._action_sequence = []
 
-    def _get_action_value(self, action):
-        return self._q_table[self._state.make_tuple() + (action,)]  # Q(s, a) -> value
+        # state of VectorCardsGuessing tables, rounds are learned from in batches by learn_batch
+        self._tables_state = None
+        self._tables_card = None  # last said card, -1 for none
+        self._tables_round = None
+        self._next_round = 0
+        self._steps = []  # (rounds, states, actions) of every act_batch
+        self._finished = []  # (rounds, rewards) in the order the rounds finished
 
     def _act(self) -> object:
         # Select action which has highest value in current state
-        greedy_action = max((self._get_action_value(action), action) for action in (State.KEEP, State.CHANGE))[1]
+        greedy_action = self._q_table.greedy(self._state)
 
         # Execute random policy with some chance
-        if random.random() > self._explorer_spirit:
+        if self._random.random() > self._explorer_spirit:
             action = greedy_action
         else:
-            action = random.choice((State.KEEP, State.CHANGE))
+            action = self._random.choice((State.KEEP, State.CHANGE))
+
+        said = self._said_card()
+        card = said if action == State.KEEP else switch_card(said)
+        self._take(card)
+        return card
+
+    def _said_card(self):
+        # the card actions are relative to: the own card at first, then the last said one
+        if self.observation[0] == FirstTurnInRound.YES or self.action is None:
+            return self.observation[1]
+        return self.action
 
+    def _take(self, card) -> None:
         # Go to next state
-        self._state = State(self._state)
-        self._state.add_event(action)
+        action = State.KEEP if card == self._said_card() else State.CHANGE
+        self._states.append(self._state)
+        self._state = self._q_table.next(self._state, action)
         self._action_sequence.append(action)
 
-        if self.observation[1] == FirstTurnInRound.YES:
-            if action == State.KEEP:
-                return self.observation[1]
-            else:
-                return switch_card(self.observation[1])
-        else:
-            if action == State.KEEP:
-                return self.action
-            else:
-                return switch_card(self.action)
-
     def _observe(self) -> None:
         if self.observation[0] == FirstTurnInRound.YES:
             # update q-table with sampled trajectory
-            state = self._state
-            current_val = self.reward
-            for action in self._action_sequence[::-1]:
-                state = state.get_prev()
-                q_table_entry = state.make_tuple() + (action,)
-                self._q_table[q_table_entry] = (1.0 - self._alpha) * self._q_table[
-                    q_table_entry] + self._alpha * current_val
-                current_val *= self._discount
+            self._q_table.update(self._states, self._action_sequence, self.reward, self._alpha, self._discount)
+            self._reset()
         if self.observation[2] == self.observation[1]:
-            self._state.add_event(State.OPPONENT_SAID_MY)
+            self._state = self._q_table.next(self._state, State.OPPONENT_SAID_MY)
         else:
-            self._state.add_event(State.OPPONENT_SAID_NOT_MY)
+            self._state = self._q_table.next(self._state, State.OPPONENT_SAID_NOT_MY)
+
+    def save(self, path: str) -> None:
+        self._q_table.save(path)
+
+    def load(self, path: str, mmap: bool = False) -> None:
+        """
+        Warm start from a saved Q table, see QTable.load
+        """
+        self._q_table = QTable.load(path, mmap)
 
     def _reset(self) -> None:
-        self._state = State()
-        self._action_sequence = []
+        self._state = QTable.ROOT
+        self._states.clear()
+        self._action_sequence.clear()
+
+    def _init_tables(self, num_envs: int) -> None:
+        self._tables_state = np.full(num_envs, QTable.ROOT, dtype=np.int64)
+        self._tables_card = np.full(num_envs, -1, dtype=np.int8)
+        self._tables_round = np.arange(num_envs, dtype=np.int64)
+        self._next_round = num_envs
+        self._steps = []
+        self._finished = []
+
+    def _batch_tables(self, observations, tables) -> np.ndarray:
+        # the state of the tables is sized by the batches, not by the env, which may be a scalar one;
+        # a batch of another number of tables starts it over, e.g. a replay after a VectorCardsGuessing run
+        if tables is None:
+            tables = np.arange(len(observations))
+            if self._tables_state is None or len(self._tables_state) != len(tables):
+                self._init_tables(len(tables))
+        elif self._tables_state is None or (len(tables) and tables.max() >= len(self._tables_state)):
+            self._init_tables(int(tables.max()) + 1 if len(tables) else 0)
+        return tables
+
+    def observe_batch(self, observations, rewards, dones, tables=None) -> None:
+        """
+        _observe of every table at once, finished rounds are kept for learn_batch instead of being learned from
+        """
+        tables = self._batch_tables(observations, tables)
+        finished = observations[:, 0] == FirstTurnInRound.YES
+        finished_tables = tables[finished]
+        self._finished.append((self._tables_round[finished_tables], np.asarray(rewards, dtype=np.float64)[finished]))
+        self._tables_round[finished_tables] = np.arange(self._next_round, self._next_round + len(finished_tables))
+        self._next_round += len(finished_tables)
+        self._tables_state[finished_tables] = QTable.ROOT
+
+        events = np.where(observations[:, 2] == observations[:, 1], State.OPPONENT_SAID_MY, State.OPPONENT_SAID_NOT_MY)
+        self._tables_state[tables] = self._q_table.next_batch(self._tables_state[tables], events)
+
+    def _take_batch(self, observations, actions, tables) -> np.ndarray:
+        states = self._tables_state[tables]
+        self._steps.append((self._tables_round[tables], states, actions))
+        self._tables_state[tables] = self._q_table.next_batch(states, actions)
+
+        previous = self._tables_card[tables]
+        said = np.where((observations[:, 0] == FirstTurnInRound.YES) | (previous < 0), observations[:, 1], previous)
+        cards = np.where(actions == State.KEEP, said, 1 - said).astype(np.int8)
+        self._tables_card[tables] = cards
+        return cards
+
+    def act_batch(self, observations, tables=None):
+        """
+        _act of every table at once with the Q table as it was at the last learn_batch
+        """
+        tables = self._batch_tables(observations, tables)
+        actions = self._q_table.greedy_batch(self._tables_state[tables])
+        explore = self._np_random.random_sample(len(tables)) <= self._explorer_spirit
+        actions[explore] = self._np_random.randint(2, size=explore.sum())
+        return self._take_batch(observations, actions, tables)
+
+    def replay_batch(self, observations, cards, tables=None) -> None:
+        """
+        Takes the given cards as the actions of the tables, e.g. from recorded trajectories
+        """
+        tables = self._batch_tables(observations, tables)
+        previous = self._tables_card[tables]
+        said = np.where((observations[:, 0] == FirstTurnInRound.YES) | (previous < 0), observations[:, 1], previous)
+        self._take_batch(observations, (np.asarray(cards) != said).astype(np.int64), tables)
+
+    def learn_batch(self, lam: float = 1.0) -> (int, float):
+        """
+        Updates the Q table from all rounds finished since the last call at once, in the order they finished,
+        with lam-returns (lam=1 learns what _observe would). Returns the number of rounds played and their reward.
+        """
+        if not self._finished:
+            return 0, 0.0
+        rounds = np.concatenate([r for r, _ in self._finished])
+        rewards = np.concatenate([r for _, r in self._finished])
+        self._finished = []
+        step_rounds, states, actions = (np.concatenate(column) for column in zip(*self._steps)) \
+            if self._steps else (np.empty(0, dtype=np.int64),) * 3
+
+        order = np.argsort(rounds)
+        position = np.minimum(np.searchsorted(rounds, step_rounds, sorter=order), len(rounds) - 1)
+        done = rounds[order[position]] == step_rounds
+        self._steps = [(step_rounds[~done], states[~done], actions[~done])]
+
+        finish_order = order[position[done]]
+        steps = np.argsort(finish_order, kind="mergesort")
+        finish_order, states, actions = finish_order[steps], states[done][steps], actions[done][steps]
+        targets = self._q_table.lambda_returns(states, finish_order, rewards, self._discount, lam)
+        self._q_table.update_batch(states, actions, targets, self._alpha)
+        played = np.zeros(len(rounds), dtype=bool)
+        played[finish_order] = True
+        return int(played.sum()), float(rewards[played].sum())
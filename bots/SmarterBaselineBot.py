@@ -9,3 +9,9 @@ class SmarterBaselineBot(Bot):
 
     def _observe(self) -> None:
         pass
+
+    def act_batch(self, observations, tables=None):
+        return 1 - observations[:, 1]
+
+    def observe_batch(self, observations, rewards, dones, tables=None) -> None:
+        pass
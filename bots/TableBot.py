@@ -0,0 +1,54 @@
+from env import Card, Guess, Player, FirstTurnInRound
+from qtable import QTable
+from .Bot import Bot
+
+
+class TableBot(Bot):
+    """
+    Plays a frozen strategy over information sets, a QTable as built by cfr.infoset_table whose values rows are
+    the probabilities of saying RED and BLACK. The walk of the round through the table moves by one transition
+    per observation and per action. Information sets missing from the table (rounds longer than the table was
+    solved for) repeat the last said card, which passes. side is the side of CardsGuessing the bot plays.
+    """
+    def __init__(self, table: QTable, side: Player = Player.PLAYER, debug: bool = False):
+        super(TableBot, self).__init__(debug)
+        self.table = table
+        self.side = side
+        self._position = QTable.ROOT
+        self._said = Guess.AWAITING_FOR_GUESS
+
+    def save(self, path: str) -> None:
+        self.table.save(path)
+
+    def load(self, path: str, mmap: bool = False) -> None:
+        self.table = QTable.load(path, mmap)
+
+    def _observe(self) -> None:
+        pass
+
+    def _new_round(self) -> bool:
+        if self.observation[0] == FirstTurnInRound.YES:
+            return True
+        # the opponent is told about a new round only when it starts it, and the player's move that ends a round
+        # is not shown to it, so a new round's first card looks like one more move: the env is asked instead
+        return self.side == Player.OPPONENT and not self.env.unwrapped.round_moves(self.side)
+
+    def _start_round(self) -> None:
+        self._position = self.table.transitions[QTable.ROOT, self.observation[1]]
+        self._said = Guess.AWAITING_FOR_GUESS
+
+    def _act(self) -> int:
+        if self._new_round():
+            self._start_round()
+        position = self._position
+        if position >= 0:
+            position = self.table.transitions[position, self.observation[2]]
+        if position < 0:
+            action = self._said if self._said != Guess.AWAITING_FOR_GUESS else self.observation[1]
+        else:
+            red, black = self.table.values[position].tolist()
+            action = Card.RED if self._random.random() * (red + black) < red else Card.BLACK
+            position = self.table.transitions[position, action]
+        self._position = position
+        self._said = Guess(action)
+        return Card(action)
@@ -1,4 +1,6 @@
-from .Bot import Bot
+from functools import partial
+
+from .Bot import Bot, RunResult
 
 from .BaselineBot import BaselineBot
 from .SmarterBaselineBot import SmarterBaselineBot
@@ -12,3 +14,18 @@ from .MishaBotV1 import MishaBotV1New
 from .MishaBotV2 import MishaBotV2
 
 from .SarsaBot import SarsaBot
+from .TableBot import TableBot
+
+
+# bots by name with the arguments they play with by default, e.g. in tournaments
+BOTS = {
+    "BaselineBot": BaselineBot,
+    "SmarterBaselineBot": SmarterBaselineBot,
+    "BlackBot": BlackBot,
+    "IlariiaB1V1Bot": IlariiaB1V1Bot,
+    "IlariiaUltimatumBot": partial(IlariiaUltimatumBot, learning_time=1000),
+    "IlariiaRandomUltimatumBot": partial(IlariiaRandomUltimatumBot, learning_time=1000),
+    "MishaBotV1New": MishaBotV1New,
+    "MishaBotV2": MishaBotV2,
+    "SarsaBot": SarsaBot,
+}
@@ -1,7 +1,11 @@
 import random
 from abc import ABCMeta, abstractmethod
+from collections import namedtuple
+from itertools import product
 from typing import Dict
-from enum import Enum
+from enum import Enum, IntEnum
+
+from rules import RoundKernel
 
 
 class Card(Enum):
@@ -14,6 +18,75 @@ class Action(Enum):
     CHANGE = "CHANGE"
 
 
+_CARDS = (Card.RED, Card.BLACK)
+_CARD_CODE = {Card.RED: 0, Card.BLACK: 1}
+_ACTIONS = (Action.PASS, Action.CHANGE)
+_ACTION_CODE = {Action.PASS: 0, Action.CHANGE: 1}
+
+
+class GameRoundPhase(IntEnum):
+    FIRST_BIDS = 0
+    SECOND_BIDS = 1
+    FIRST_MOVES = 2  # first player of the round acts, after a PASS the second one gets the last action
+    SECOND_MOVES = 3
+    FIRST_LAST = 4  # first player acts once more and the round is resolved
+    SECOND_LAST = 5
+    FINISHED = 6
+
+
+GameRoundState = namedtuple("GameRoundState", "cards bids phase")
+
+
+class GameRoundRules(object):
+    """
+    Rules of a GameRound for RoundKernel. Pairs in GameRoundState are (first player, second player) of the round.
+    Actions are cards (_CARDS) while bidding and PASS/CHANGE (_ACTIONS) afterwards. Money stays in GameRound:
+    a player without money to change is made to PASS and the bank is split according to the payoff table,
+    which holds whether each player guessed right.
+    """
+    @staticmethod
+    def initial_states():
+        return {(card1, card2): GameRoundState((card1, card2), (None, None), GameRoundPhase.FIRST_BIDS)
+                for card1, card2 in product(_CARDS, _CARDS)}
+
+    @staticmethod
+    def mover(state: GameRoundState):
+        if state.phase == GameRoundPhase.FINISHED:
+            return None
+        return 0 if state.phase in (GameRoundPhase.FIRST_BIDS, GameRoundPhase.FIRST_MOVES, GameRoundPhase.FIRST_LAST) else 1
+
+    @classmethod
+    def apply(cls, state: GameRoundState, action: int) -> GameRoundState:
+        mover = cls.mover(state)
+        if state.phase == GameRoundPhase.FIRST_BIDS:
+            return state._replace(bids=(_CARDS[action], None), phase=GameRoundPhase.SECOND_BIDS)
+        if state.phase == GameRoundPhase.SECOND_BIDS:
+            return state._replace(bids=(state.bids[0], _CARDS[action]), phase=GameRoundPhase.FIRST_MOVES)
+
+        bids = state.bids
+        if _ACTIONS[action] == Action.CHANGE:
+            changed = Card.RED if bids[mover] == Card.BLACK else Card.BLACK
+            bids = (changed, bids[1]) if mover == 0 else (bids[0], changed)
+        if state.phase in (GameRoundPhase.FIRST_LAST, GameRoundPhase.SECOND_LAST):
+            phase = GameRoundPhase.FINISHED
+        elif _ACTIONS[action] == Action.CHANGE:
+            phase = GameRoundPhase.SECOND_MOVES if mover == 0 else GameRoundPhase.FIRST_MOVES
+        else:
+            phase = GameRoundPhase.SECOND_LAST if mover == 0 else GameRoundPhase.FIRST_LAST
+        return state._replace(bids=bids, phase=phase)
+
+    @staticmethod
+    def payoff(state: GameRoundState) -> (bool, bool):
+        return state.bids[0] == state.cards[1], state.bids[1] == state.cards[0]
+
+
+ROUND_KERNEL = RoundKernel(GameRoundRules())
+_NEXT_STATE = ROUND_KERNEL.next_state
+_MOVER = ROUND_KERNEL.mover
+_CORRECT = ROUND_KERNEL.payoff
+_BIDS = ROUND_KERNEL.table(lambda state: state.bids)
+
+
 class Player(object):
     __metaclass__ = ABCMeta
 
@@ -55,16 +128,63 @@ class Player(object):
         raise NotImplementedError()
 
 
+# Events passed to the hook of GameRound and Game, only built when a hook is attached
+CardDealt = namedtuple("CardDealt", "player card")
+BidMade = namedtuple("BidMade", "player bid money bank")
+ActionMade = namedtuple("ActionMade", "player action bid money bank")
+CardsOpened = namedtuple("CardsOpened", "player1 card1 player2 card2")
+RoundResolved = namedtuple("RoundResolved", "player1 correct1 player2 correct2")
+GameStarted = namedtuple("GameStarted", "player1 player2")
+RoundStarted = namedtuple("RoundStarted", "round player1 money1 player2 money2")
+RoundPlayed = namedtuple("RoundPlayed", "round first_player value1 second_player value2 player1 money1 player2 money2")
+PlayerRuined = namedtuple("PlayerRuined", "rounds player")
+
+
+def _format_resolved(event: RoundResolved) -> str:
+    if event.correct1 and event.correct2:
+        return "Both player guessed right"
+    if event.correct1:
+        return "%s guessed right and %s guessed wrong" % (event.player1.name, event.player2.name)
+    if event.correct2:
+        return "%s guessed right and %s guessed wrong" % (event.player2.name, event.player1.name)
+    return "Both player guessed wrong"
+
+
+_FORMATS = {
+    CardDealt: lambda e: "%s got card %s" % (e.player.name, e.card.name),
+    BidMade: lambda e: "%s made first bid %s. Its money: %s. Bank: %s" % (e.player.name, e.bid.name, e.money, e.bank),
+    ActionMade: lambda e: "%s made action %s. Its bid now %s. Its money: %s. Bank: %s" % (
+        e.player.name, e.action.name, e.bid.name, e.money, e.bank),
+    CardsOpened: lambda e: "%s had %s and %s had %s" % (e.player1.name, e.card1.name, e.player2.name, e.card2.name),
+    RoundResolved: _format_resolved,
+    GameStarted: lambda e: "-------------\nGame start\n-------------\n",
+    RoundStarted: lambda e: "Round %s\n\nBefore round %s %s have %s and %s have %s" % (
+        e.round, e.round + 1, e.player1.name, e.money1, e.player2.name, e.money2),
+    RoundPlayed: lambda e: "%s won %s and %s won %s\nAfter %s rounds %s got %s and %s got %s\n" % (
+        e.first_player.name, e.value1, e.second_player.name, e.value2,
+        e.round + 1, e.player1.name, e.money1, e.player2.name, e.money2),
+    PlayerRuined: lambda e: "Game result:\n\nAfter %s rounds player %s run out of money AND TOTALLY LOST\n" % (
+        e.rounds, e.player.name),
+}
+
+
+def format_event(event) -> str:
+    return _FORMATS[type(event)](event)
+
+
+def print_event(event) -> None:
+    print(format_event(event))
+
+
 class GameRound(object):
     CARDS = [Card.RED, Card.RED, Card.BLACK, Card.BLACK]
 
-    def info(self, message):
-        if self.debug:
-            print(message)
-        else:
-            pass
-
-    def __init__(self, player1: Player, money1: int, player2: Player, money2: int, debug: bool = False):
+    def __init__(self, player1: Player, money1: int, player2: Player, money2: int, debug: bool = False, hook=None,
+                 cards=None):
+        """
+        hook is called with every event of the round, debug=True prints them.
+        cards are the cards of player1 and player2 to deal instead of random ones
+        """
         assert money1 >= 10, money1
         assert money2 >= 10, money2
         self.player1 = player1
@@ -73,31 +193,40 @@ class GameRound(object):
         self.current_money = {player1: money1, player2: money2}
         self.bank: int = 0
         self.debug = debug
+        self.hook = print_event if hook is None and debug else hook
 
-        card1, card2 = random.sample(self.CARDS, 2)
+        card1, card2 = random.sample(self.CARDS, 2) if cards is None else cards
         self.cards: Dict[Player, Card] = {self.player1: card1, self.player2: card2}
+        self._movers = (self.player1, self.player2)
+        self._state = ROUND_KERNEL.initial[(card1, card2)]
         self.player1.take_card(card1)
-        self.info("%s got card %s" % (self.player1.name, card1.name))
+        if self.hook is not None:
+            self.hook(CardDealt(self.player1, card1))
         self.player2.take_card(card2)
-        self.info("%s got card %s" % (self.player2.name, card2.name))
+        if self.hook is not None:
+            self.hook(CardDealt(self.player2, card2))
 
         self.bank += 20
         self.current_money[self.player1] -= 10
         self.current_money[self.player2] -= 10
-        # noinspection PyDictCreation
-        self.bids: Dict[Player, Card] = {}
 
-        self.bids[self.player1] = self.player1.say_card()
+        self._move(self.player1, _CARD_CODE[self.player1.say_card()])
         self.player2.opponent_said_card(self.bids[self.player1])
-        self.bids[self.player2] = self.player2.say_card()
+        self._move(self.player2, _CARD_CODE[self.player2.say_card()])
         self.player1.opponent_said_card(self.bids[self.player2])
 
-        self.info("%s made first bid %s. Its money: %s. Bank: %s" % (self.player1.name, self.bids[player1].name,
-                                                                     self.current_money[player1],
-                                                                     self.bank))
-        self.info("%s made first bid %s. Its money: %s. Bank: %s" % (self.player2.name, self.bids[player2].name,
-                                                                     self.current_money[player2],
-                                                                     self.bank))
+        if self.hook is not None:
+            for player in (player1, player2):
+                self.hook(BidMade(player, self.bids[player], self.current_money[player], self.bank))
+
+    @property
+    def bids(self) -> Dict[Player, Card]:
+        bid1, bid2 = _BIDS[self._state]
+        return {self.player1: bid1, self.player2: bid2}
+
+    def _move(self, player: Player, action: int):
+        assert self._movers[_MOVER[self._state]] is player, (self._state, player.name)
+        self._state = _NEXT_STATE[self._state][action]
 
     def play(self) -> (int, int):
         value1, value2 = self._run_game(self.player1, self.player2)
@@ -111,17 +240,15 @@ class GameRound(object):
         return value1, value2
 
     def _run_game(self, player1: Player, player2: Player):
-        action = self._make_action(player1, player2)
-
-        if action == Action.PASS:
-            self._make_action(player2, player1)
+        # players change in turns until one of them passes, then the other one acts for the last time
+        while self._make_action(player1, player2) != Action.PASS:
+            player1, player2 = player2, player1
+        self._make_action(player2, player1)
 
-            player1.opponent_card(self.cards[player2])
-            player2.opponent_card(self.cards[player1])
+        player1.opponent_card(self.cards[player2])
+        player2.opponent_card(self.cards[player1])
 
-            return self._resolve()
-        else:
-            return self._run_game(player2, player1)
+        return self._resolve()
 
     def _make_action(self, player: Player, opponent: Player) -> Action:
         if self.current_money[player] < 10:
@@ -132,87 +259,75 @@ class GameRound(object):
             if player_action == Action.CHANGE:
                 self.current_money[player] -= 10
                 self.bank += 10
-                self.bids[player] = Card.RED if self.bids[player] == Card.BLACK else Card.BLACK
-
-        if player_action != Action.PASS:
-            self.info("%s made action %s. Its bid now %s. Its money: %s. Bank: %s" % (player.name,
-                                                                                      player_action.name,
-                                                                                      self.bids[player].name,
-                                                                                      self.current_money[player],
-                                                                                      self.bank))
+        self._move(player, _ACTION_CODE[player_action])
+
+        if player_action != Action.PASS and self.hook is not None:
+            self.hook(ActionMade(player, player_action, self.bids[player], self.current_money[player], self.bank))
         return player_action
 
     def _resolve(self) -> (int, int):
-        p1_correct = self.bids[self.player1] == self.cards[self.player2]
-        p2_correct = self.bids[self.player2] == self.cards[self.player1]
-        self.info("%s had %s and %s had %s" % (self.player1.name, self.cards[self.player1].name,
-                                               self.player2.name, self.cards[self.player2].name))
+        p1_correct, p2_correct = _CORRECT[self._state]
+        if self.hook is not None:
+            self.hook(CardsOpened(self.player1, self.cards[self.player1], self.player2, self.cards[self.player2]))
         if p1_correct and p2_correct:
             value = self.bank / 2
             p1_value = self.current_money[self.player1] + value - self.starting_money[self.player1]
             p2_value = self.current_money[self.player2] + value - self.starting_money[self.player2]
             assert p1_value + p2_value == 0.0, (p1_value, p2_value)
-            self.info("Both player guessed right")
         elif p1_correct and not p2_correct:
-            self.info("%s guessed right and %s guessed wrong" % (self.player1.name, self.player2.name))
             p1_value = self.current_money[self.player1] + self.bank - self.starting_money[self.player1]
             p2_value = self.current_money[self.player2] - self.starting_money[self.player2]
         elif not p1_correct and p2_correct:
-            self.info("%s guessed right and %s guessed wrong" % (self.player2.name, self.player1.name))
             p1_value = self.current_money[self.player1] - self.starting_money[self.player1]
             p2_value = self.current_money[self.player2] + self.bank - self.starting_money[self.player2]
         else:
-            self.info("Both player guessed wrong")
             p1_value, p2_value = 0.0, 0.0
+        if self.hook is not None:
+            self.hook(RoundResolved(self.player1, p1_correct, self.player2, p2_correct))
         assert p1_value + p2_value == 0.0, (p1_value, p2_value)
         return p1_value, p2_value
 
 
 class Game(object):
-    def __init__(self, player1: Player, money1: int, player2: Player, money2: int, rounds: int, debug: bool = False):
+    def __init__(self, player1: Player, money1: int, player2: Player, money2: int, rounds: int, debug: bool = False,
+                 hook=None):
+        """
+        hook is called with every event of the game and its rounds, debug=True prints them
+        """
         self.player1 = player1
         self.player2 = player2
         self.current_money = {player1: money1, player2: money2}
         self.rounds = rounds
         self.debug = debug
-
-    def info(self, message):
-        if self.debug:
-            print(message)
-        else:
-            pass
+        self.hook = print_event if hook is None and debug else hook
 
     def run(self) -> Player:
-        self.info("-------------\nGame start\n-------------\n")
+        if self.hook is not None:
+            self.hook(GameStarted(self.player1, self.player2))
         for i in range(self.rounds):
-            self.info("Round %s\n" % i)
             if i % 2 == 0:
                 first_player, second_player = self.player1, self.player2
             else:
                 first_player, second_player = self.player2, self.player1
-            self.info("Before round %s %s have %s and %s have %s" % (i + 1,
-                                                                     self.player1.name,
-                                                                     self.current_money[self.player1],
-                                                                     self.player2.name,
-                                                                     self.current_money[self.player2]))
+            if self.hook is not None:
+                self.hook(RoundStarted(i, self.player1, self.current_money[self.player1],
+                                       self.player2, self.current_money[self.player2]))
             gameround = GameRound(first_player, self.current_money[first_player],
-                                  second_player, self.current_money[second_player], self.debug)
+                                  second_player, self.current_money[second_player], hook=self.hook)
             value1, value2 = gameround.play()
-            self.info("%s won %s and %s won %s" % (first_player.name, value1, second_player.name, value2))
             self.current_money[first_player] += value1
             assert self.current_money[first_player] >= 0
             self.current_money[second_player] += value2
             assert self.current_money[second_player] >= 0
-            self.info("After %s rounds %s got %s and %s got %s\n" % (i + 1,
-                                                                     self.player1.name,
-                                                                     self.current_money[self.player1],
-                                                                     self.player2.name,
-                                                                     self.current_money[self.player2]))
+            if self.hook is not None:
+                self.hook(RoundPlayed(i, first_player, value1, second_player, value2,
+                                      self.player1, self.current_money[self.player1],
+                                      self.player2, self.current_money[self.player2]))
             if self.current_money[self.player1] < 10:
-                self.info("Game result:\n")
-                self.info("After %s rounds player %s run out of money AND TOTALLY LOST\n" % (i + 1, self.player1.name))
+                if self.hook is not None:
+                    self.hook(PlayerRuined(i + 1, self.player1))
                 return self.player2
             if self.current_money[self.player2] < 10:
-                self.info("Game result:\n")
-                self.info("After %s rounds player %s run out of money AND TOTALLY LOST\n" % (i + 1, self.player2.name))
+                if self.hook is not None:
+                    self.hook(PlayerRuined(i + 1, self.player2))
                 return self.player1
@@ -0,0 +1,273 @@
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from env import Player, ROUND_KERNEL, MOVER, NEXT_STATE, PAYOFF, SAID
+from exact import DEALS
+from qtable import QTable
+
+
+CfrPoint = namedtuple("CfrPoint", "iteration exploitability value seconds")
+
+
+def infoset_table() -> QTable:
+    """
+    Information sets of one side of a round as a QTable trie: the root is followed by the own card, then for every
+    own move by the card the opponent says at that moment (a Guess) and the own action (a Card).
+    States reached by the opponent's card are the information sets, their values row is the strategy.
+    """
+    return QTable(events=3, actions=2)
+
+
+def frozen_table(table: QTable, values: np.ndarray) -> QTable:
+    """
+    Copy of the trie of table with the given values rows, sized to it
+    """
+    frozen = QTable(table.events, table.actions, capacity=len(table))
+    for name in ("transitions", "parent", "event"):
+        getattr(frozen, name)[:len(table)] = getattr(table, name)[:len(table)]
+    frozen.values[:len(table)] = values
+    frozen.size = len(table)
+    return frozen
+
+
+class GameTree(object):
+    """
+    All rounds of CardsGuessing as a tree over ROUND_KERNEL states, each side moving at most max_moves times
+    (or max_moves[side]) by choice: after that its move is to repeat its card, which passes.
+    Nodes are numbered level by level, so a level is a contiguous range and children of a level are in the next one.
+    Every decision node belongs to the information set tables[mover] state infoset[n], state[n] is the
+    ROUND_KERNEL state of the node.
+    """
+    def __init__(self, max_moves=6):
+        self.max_moves = (max_moves, max_moves) if isinstance(max_moves, int) else tuple(max_moves)
+        assert min(self.max_moves) >= 1, max_moves
+        self.tables = (infoset_table(), infoset_table())
+        mover, infoset, children, payoff, chance, states, levels = [], [], [], [], [], [], []
+
+        level = []
+        for cards, probability in DEALS.items():
+            for starting_player in Player:
+                positions = tuple(self.tables[side].next(QTable.ROOT, cards[side]) for side in Player)
+                level.append((ROUND_KERNEL.initial[cards + (starting_player,)], positions, (0, 0), probability / 2))
+        while level:
+            levels.append((len(mover), len(mover) + len(level)))
+            following = []
+            for state, positions, moves, probability in level:
+                state, moves = self._forced(state, moves)
+                chance.append(probability)
+                states.append(state)
+                side = MOVER[state]
+                if side is None:
+                    mover.append(-1)
+                    infoset.append(-1)
+                    children.append((-1, -1))
+                    payoff.append(PAYOFF[state][Player.PLAYER])
+                    continue
+                position = self.tables[side].next(positions[side], SAID[state][1 - side])
+                mover.append(side)
+                infoset.append(position)
+                payoff.append(0.0)
+                children.append(tuple(levels[-1][1] + len(following) + action for action in range(2)))
+                for action in range(2):
+                    next_positions = positions[:side] + (self.tables[side].next(position, action),) + \
+                        positions[side + 1:]
+                    next_moves = moves[:side] + (moves[side] + 1,) + moves[side + 1:]
+                    following.append((NEXT_STATE[state][action], next_positions, next_moves, probability))
+            level = following
+
+        self.mover = np.array(mover, dtype=np.int8)
+        self.infoset = np.array(infoset, dtype=np.int64)
+        self.children = np.array(children, dtype=np.int64)
+        self.payoff = np.array(payoff, dtype=np.float64)
+        self.chance = np.array(chance, dtype=np.float64)
+        self.state = np.array(states, dtype=np.int64)
+        self.levels = levels
+
+    def _forced(self, state: int, moves: tuple) -> (int, tuple):
+        # sides out of moves repeat their card
+        side = MOVER[state]
+        while side is not None and moves[side] >= self.max_moves[side]:
+            state = NEXT_STATE[state][SAID[state][side]]
+            moves = moves[:side] + (moves[side] + 1,) + moves[side + 1:]
+            side = MOVER[state]
+        return state, moves
+
+    def __len__(self):
+        return len(self.mover)
+
+
+def _reach(tree: GameTree, strategies: tuple) -> np.ndarray:
+    """
+    reach[n, side]: product of the probabilities of side's actions on the way to node n
+    """
+    reach = np.ones((len(tree), 2))
+    decisions = tree.mover >= 0
+    for start, stop in tree.levels[:-1]:
+        nodes = np.arange(start, stop)[decisions[start:stop]]
+        for side in Player:
+            mine = nodes[tree.mover[nodes] == side]
+            children = tree.children[mine]
+            probabilities = strategies[side][tree.infoset[mine]]
+            reach[children] = reach[mine, None, :]
+            reach[children, side] *= probabilities
+    return reach
+
+
+def _values(tree: GameTree, strategies: tuple) -> np.ndarray:
+    """
+    The player's expected round reward from every node on
+    """
+    values = tree.payoff.copy()
+    decisions = tree.mover >= 0
+    for start, stop in reversed(tree.levels[:-1]):
+        nodes = np.arange(start, stop)[decisions[start:stop]]
+        for side in Player:
+            mine = nodes[tree.mover[nodes] == side]
+            values[mine] = (strategies[side][tree.infoset[mine]] * values[tree.children[mine]]).sum(axis=1)
+    return values
+
+
+def _node_strategies(tree: GameTree, strategies: tuple) -> np.ndarray:
+    probabilities = np.zeros((len(tree), 2))
+    for side in Player:
+        mine = np.flatnonzero(tree.mover == side)
+        probabilities[mine] = strategies[side][tree.infoset[mine]]
+    return probabilities
+
+
+def best_response(tree: GameTree, side: Player, node_strategy: np.ndarray) -> (float, dict):
+    """
+    Best response of side against the other side playing node_strategy[n] at its nodes n:
+    its expected round reward (the player's reward negated for the opponent) and action by information set.
+    Decisions are taken by backward induction over side's information sets, which perfect recall makes exact.
+    """
+    sign = 1.0 if side == Player.PLAYER else -1.0
+    mover, children, infoset = tree.mover.tolist(), tree.children.tolist(), tree.infoset.tolist()
+    payoff, node_strategy = tree.payoff.tolist(), node_strategy.tolist()
+
+    # chance times the other side's reach weights the nodes of an information set
+    weight = tree.chance.copy()
+    for start, stop in tree.levels[:-1]:
+        for n in range(start, stop):
+            if mover[n] >= 0:
+                for action in range(2):
+                    child = children[n][action]
+                    weight[child] = weight[n] * (node_strategy[n][action] if mover[n] != side else 1.0)
+    weight = weight.tolist()
+    members = {}
+    for n in range(len(tree)):
+        if mover[n] == side:
+            members.setdefault(infoset[n], []).append(n)
+
+    policy = {}
+    values = [None] * len(tree)
+
+    def choose(position: int) -> int:
+        action = policy.get(position)
+        if action is None:
+            totals = [sum(weight[n] * value(children[n][a]) for n in members[position]) for a in range(2)]
+            action = policy[position] = int(totals[1] > totals[0])
+        return action
+
+    def value(n: int) -> float:
+        if values[n] is None:
+            if mover[n] < 0:
+                values[n] = sign * payoff[n]
+            elif mover[n] == side:
+                values[n] = value(children[n][choose(infoset[n])])
+            else:
+                values[n] = sum(p * value(child) for p, child in zip(node_strategy[n], children[n]))
+        return values[n]
+
+    start, stop = tree.levels[0]
+    root_value = sum(tree.chance[n] * value(n) for n in range(start, stop))
+    for position in members:
+        choose(position)
+    return root_value, policy
+
+
+def exploitability(tree: GameTree, strategies: tuple) -> float:
+    """
+    Mean gain of the best responses of both sides over the game value, 0 at an equilibrium
+    """
+    node_strategy = _node_strategies(tree, strategies)
+    return sum(best_response(tree, side, node_strategy)[0] for side in Player) / 2
+
+
+class CfrSolver(object):
+    """
+    CFR+ over a GameTree: regret matching on clipped cumulative regrets, sides updated in turns and the
+    average strategy weighted by iteration. Every level of the tree is one numpy step in both passes.
+    """
+    def __init__(self, tree: GameTree = None):
+        self.tree = GameTree() if tree is None else tree
+        self.regrets = tuple(np.zeros((len(table), 2)) for table in self.tree.tables)
+        self.strategy_sums = tuple(np.zeros((len(table), 2)) for table in self.tree.tables)
+        self.iterations = 0
+        self._decisions = tuple(np.flatnonzero(self.tree.mover == side) for side in Player)
+
+    @staticmethod
+    def _matched(regrets: np.ndarray) -> np.ndarray:
+        positive = np.maximum(regrets, 0.0)
+        totals = positive.sum(axis=1, keepdims=True)
+        return np.where(totals > 0, positive / np.where(totals > 0, totals, 1.0), 0.5)
+
+    @property
+    def strategies(self) -> tuple:
+        return tuple(self._matched(regrets) for regrets in self.regrets)
+
+    @property
+    def average_strategies(self) -> tuple:
+        return tuple(self._matched(sums) for sums in self.strategy_sums)
+
+    def iterate(self) -> None:
+        tree = self.tree
+        self.iterations += 1
+        # alternating updates: the opponent answers the player's strategy of this iteration
+        for side in Player:
+            strategies = self.strategies
+            reach = _reach(tree, strategies)
+            values = _values(tree, strategies)
+            nodes = self._decisions[side]
+            sign = 1.0 if side == Player.PLAYER else -1.0
+            counterfactual = (sign * tree.chance[nodes] * reach[nodes, 1 - side])[:, None]
+            regrets = counterfactual * (values[tree.children[nodes]] - values[nodes, None])
+            np.add.at(self.regrets[side], tree.infoset[nodes], regrets)
+            np.maximum(self.regrets[side], 0.0, out=self.regrets[side])
+            np.add.at(self.strategy_sums[side], tree.infoset[nodes],
+                      self.iterations * reach[nodes, side, None] * strategies[side][tree.infoset[nodes]])
+
+    def solve(self, iterations: int = 1000, report_every: int = 10, on_report=None) -> list:
+        """
+        Runs iterations and returns a CfrPoint with the exploitability and the player's round value
+        of the average strategies every report_every iterations
+        """
+        curve = []
+        start = time.time()
+        for _ in range(iterations):
+            self.iterate()
+            if self.iterations % report_every == 0:
+                strategies = self.average_strategies
+                point = CfrPoint(iteration=self.iterations,
+                                 exploitability=float(exploitability(self.tree, strategies)),
+                                 value=float(self.tree.chance[slice(*self.tree.levels[0])] @
+                                             _values(self.tree, strategies)[slice(*self.tree.levels[0])]),
+                                 seconds=time.time() - start)
+                curve.append(point)
+                if on_report is not None:
+                    on_report(point)
+        return curve
+
+    def table(self, side: Player) -> QTable:
+        """
+        Information set table of side with the average strategy as values, for bots.TableBot
+        """
+        return frozen_table(self.tree.tables[side], self.average_strategies[side])
+
+
+if __name__ == "__main__":
+    solver = CfrSolver()
+    for point in solver.solve(1000, report_every=100):
+        print(point)
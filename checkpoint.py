@@ -0,0 +1,73 @@
+import json
+from collections import namedtuple
+
+import numpy as np
+
+
+MAGIC = b"CGCKPT\x00\x00"
+VERSION = 1
+_ALIGNMENT = 64
+
+Checkpoint = namedtuple("Checkpoint", "kind version attributes arrays")
+
+
+def _aligned(offset: int) -> int:
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def save(path: str, kind: str, arrays: dict, **attributes) -> None:
+    """
+    Writes named arrays and JSON attributes of a learner into one binary file:
+    magic, version and header length, a JSON header describing the arrays, then the raw arrays
+    aligned to 64 bytes so they can be memory-mapped in place.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    descriptions = []
+    header = b""
+    # offsets depend on the header length, which depends on the offsets, so settle it until it stops changing
+    while True:
+        offset = _aligned(len(MAGIC) + 8 + len(header))
+        descriptions = []
+        for name, array in arrays.items():
+            descriptions.append({"name": name, "dtype": np.lib.format.dtype_to_descr(array.dtype),
+                                 "shape": list(array.shape), "offset": offset})
+            offset = _aligned(offset + array.nbytes)
+        settled = json.dumps({"kind": kind, "attributes": attributes, "arrays": descriptions}).encode()
+        settled += b" " * (_aligned(len(MAGIC) + 8 + len(settled)) - len(MAGIC) - 8 - len(settled))
+        if len(settled) == len(header):
+            header = settled
+            break
+        header = settled
+    assert not descriptions or len(MAGIC) + 8 + len(header) <= descriptions[0]["offset"], (len(header), descriptions)
+    with open(path, "wb") as f:
+        f.write(MAGIC + np.array([VERSION, len(header)], dtype="<u4").tobytes() + header)
+        for description, array in zip(descriptions, arrays.values()):
+            f.seek(description["offset"])
+            f.write(array.tobytes())
+
+
+def load(path: str, kind: str = None, mmap: bool = False) -> Checkpoint:
+    """
+    Reads a checkpoint written by save. With mmap the arrays are copy-on-write maps of the file, so processes
+    forked from a loader share one copy of the pages until they write to them.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a checkpoint" % path)
+        version, header_length = np.frombuffer(f.read(8), dtype="<u4")
+        if version != VERSION:
+            raise ValueError("%s has checkpoint version %s, supported is %s" % (path, version, VERSION))
+        header = json.loads(f.read(int(header_length)).decode())
+        if kind is not None and header["kind"] != kind:
+            raise ValueError("%s holds %s, not %s" % (path, header["kind"], kind))
+        arrays = {}
+        for description in header["arrays"]:
+            dtype = np.dtype(description["dtype"])
+            shape = tuple(description["shape"])
+            if mmap and int(np.prod(shape)) > 0:
+                arrays[description["name"]] = np.memmap(path, dtype=dtype, mode="c", offset=description["offset"],
+                                                        shape=shape)
+            else:
+                f.seek(description["offset"])
+                arrays[description["name"]] = np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+    return Checkpoint(kind=header["kind"], version=int(version), attributes=header["attributes"], arrays=arrays)
@@ -1,6 +1,7 @@
 import sys
 import random
-from itertools import zip_longest
+from collections import namedtuple
+from itertools import product
 from io import StringIO
 from enum import IntEnum
 from typing import Dict, List
@@ -9,6 +10,8 @@ import logging
 from gym import Env
 from gym.spaces import Discrete, MultiDiscrete
 
+from rules import RoundKernel
+
 logging.disable(logging.WARNING)
 
 
@@ -29,17 +32,150 @@ class Card(IntEnum):
     BLACK = 1
 
 
+_CARDS = (Card.RED, Card.BLACK)
+
+
 class Player(IntEnum):
     PLAYER = 0
     OPPONENT = 1
 
 
+_GUESS_OF_CARD = (Guess.RED, Guess.BLACK)
+
+
 def switch_card(value: int) -> int:
     if value == Card.RED:
         return Card.BLACK
     return Card.RED
 
 
+class RoundPhase(IntEnum):
+    PLAYER = 0  # player to move
+    OPPONENT = 1  # opponent to move, then player
+    OPPONENT_LAST = 2  # opponent to move, then the round is finished
+    FINISHED = 3
+
+
+RoundState = namedtuple("RoundState", "card said spent repeated length_diff phase")
+
+
+def _with(pair: tuple, player: Player, value) -> tuple:
+    return (value, pair[1]) if player == Player.PLAYER else (pair[0], value)
+
+
+class CardsGuessingRules(object):
+    """
+    Rules of a CardsGuessing round for RoundKernel, actions are cards.
+
+    Pairs in RoundState are indexed by Player, length_diff is the number of player's steps minus opponent's steps
+    clipped at 2: only the player keeps moving after the opponent passed and passing only looks at equal lengths.
+    Money is not a part of the state: a round starts with at least 10 on both sides and only a repeated guess
+    costs money, which passes anyway.
+    """
+    @staticmethod
+    def initial_states():
+        return {(player_card, opponent_card, starting_player): RoundState(
+            card=(player_card, opponent_card),
+            said=(Guess.AWAITING_FOR_GUESS, Guess.AWAITING_FOR_GUESS),
+            spent=(0, 0),
+            repeated=(False, False),
+            length_diff=0,
+            phase=RoundPhase.PLAYER if starting_player == Player.PLAYER else RoundPhase.OPPONENT
+        ) for player_card, opponent_card, starting_player in product(Card, Card, Player)}
+
+    @staticmethod
+    def mover(state: RoundState):
+        if state.phase == RoundPhase.FINISHED:
+            return None
+        return Player.PLAYER if state.phase == RoundPhase.PLAYER else Player.OPPONENT
+
+    @staticmethod
+    def passed(state: RoundState) -> tuple:
+        same_length = state.length_diff == 0
+        player, opponent = state.repeated
+        return player or (opponent and same_length), opponent or (player and same_length)
+
+    @classmethod
+    def apply(cls, state: RoundState, action: int) -> RoundState:
+        mover = cls.mover(state)
+        guess = _GUESS_OF_CARD[action]
+        repeated = state.said[mover] == guess
+        state = state._replace(said=_with(state.said, mover, guess),
+                               spent=_with(state.spent, mover, state.spent[mover] + 10 * repeated),
+                               repeated=_with(state.repeated, mover, repeated))
+        if mover == Player.OPPONENT:
+            phase = RoundPhase.PLAYER if state.phase == RoundPhase.OPPONENT else RoundPhase.FINISHED
+            return state._replace(length_diff=state.length_diff - 1, phase=phase)
+
+        state = state._replace(length_diff=min(state.length_diff + 1, 2))
+        player_passed, opponent_passed = cls.passed(state)
+        if not player_passed:
+            phase = RoundPhase.PLAYER if opponent_passed else RoundPhase.OPPONENT
+        else:
+            phase = RoundPhase.FINISHED if opponent_passed else RoundPhase.OPPONENT_LAST
+        return state._replace(phase=phase)
+
+    @staticmethod
+    def payoff(state: RoundState) -> tuple:
+        player_correct = state.card[Player.OPPONENT] == state.said[Player.PLAYER]
+        opponent_correct = state.card[Player.PLAYER] == state.said[Player.OPPONENT]
+        player_spent, opponent_spent = state.spent
+        bank = player_spent + opponent_spent
+
+        if player_correct and opponent_correct:
+            value = bank / 2
+            p_value = value
+            o_value = value
+        elif player_correct and not opponent_correct:
+            p_value = bank
+            o_value = 0.0
+        elif not player_correct and opponent_correct:
+            p_value = 0.0
+            o_value = bank
+        else:
+            p_value = player_spent
+            o_value = opponent_spent
+        player_reward = p_value - player_spent
+        opponent_reward = o_value - opponent_spent
+        assert player_reward + opponent_reward == 0.0, (player_reward, opponent_reward)
+        return player_reward, opponent_reward
+
+    @staticmethod
+    def observations(state: RoundState) -> tuple:
+        return tuple((FirstTurnInRound.NO, state.card[p], state.said[o], Guess.AWAITING_FOR_GUESS)
+                     for p, o in ((Player.PLAYER, Player.OPPONENT), (Player.OPPONENT, Player.PLAYER)))
+
+
+ROUND_KERNEL = RoundKernel(CardsGuessingRules())
+# lookup tables by state number, also read by the exact solvers (exact, cfr, exploit)
+NEXT_STATE = ROUND_KERNEL.next_state
+MOVER = ROUND_KERNEL.mover
+PAYOFF = ROUND_KERNEL.payoff
+PHASE = ROUND_KERNEL.table(lambda state: state.phase)
+SAID = ROUND_KERNEL.table(lambda state: state.said)
+SPENT = ROUND_KERNEL.table(lambda state: state.spent)
+PASSED = ROUND_KERNEL.table(CardsGuessingRules.passed)
+OBSERVATIONS = ROUND_KERNEL.table(CardsGuessingRules.observations)
+CARD = ROUND_KERNEL.table(lambda state: state.card)
+NO_PREVIOUS = (Guess.AWAITING_FOR_GUESS, Guess.AWAITING_FOR_GUESS)  # previous cards before the first round
+
+
+def mover_observation(state: int, first_move: bool, previous: tuple = NO_PREVIOUS) -> tuple:
+    """
+    Observation of the side to move in state, first_move telling whether it has not moved in the round yet.
+    The first observation of the round tells previous cards (of the player, of the opponent),
+    the opponent gets it only when it starts the round.
+    """
+    side = MOVER[state]
+    said = SAID[state]
+    if first_move and (side == Player.PLAYER or said[Player.PLAYER] == Guess.AWAITING_FOR_GUESS):
+        return FirstTurnInRound.YES, CARD[state][side], said[1 - side], previous[side]
+    return OBSERVATIONS[state][side]
+
+
+EnvSnapshot = namedtuple("EnvSnapshot", "card money steps starting_player wins round_state")
+
+
 # return {
 #     "names": ("Player", "Opponent"),
 #     "cards": (None, None) if not finished else (real_cards[cls._player], real_cards[cls._opponent]),
@@ -64,8 +200,9 @@ class CardsGuessing(Env):
     # noinspection PyTypeChecker
     observation_space = MultiDiscrete([[0, 1], [0, 1], [0, 2], [0, 2]])  # FirstTurnInRound x Card x Guess x Guess
 
-    def __init__(self, starting_money, opponent):
+    def __init__(self, starting_money, opponent, seed=None):
         super(CardsGuessing, self).__init__()
+        self._random = random.Random(seed)
         self._opponent_agent = opponent
         self._starting_money = starting_money
         self._start_new_round(starting_money, starting_money)
@@ -74,11 +211,18 @@ class CardsGuessing(Env):
         opponent.set_env(self)
 
     def _start_new_round(self, player_money: int, opponent_money: int):
-        player_card, opp_card = random.sample([Card.RED, Card.RED, Card.BLACK, Card.BLACK], 2)
+        player_card, opp_card = self._random.sample([Card.RED, Card.RED, Card.BLACK, Card.BLACK], 2)
         self._card: Dict[Player, Card] = {self._player: player_card, self._opponent: opp_card}
         self._money = {self._player: player_money, self._opponent: opponent_money}
         self._steps = {p: [] for p in self._all_players}
-        self._starting_player: Player = random.choice(self._all_players)
+        self._starting_player: Player = self._random.choice(self._all_players)
+        # everything else about the round is in the ROUND_KERNEL state, advanced by _append_step
+        self._round_state = ROUND_KERNEL.initial[(player_card, opp_card, self._starting_player)]
+
+    def _append_step(self, player: Player, action: Card):
+        assert MOVER[self._round_state] == player, (self._round_state, player)
+        self._steps[player].append(action)
+        self._round_state = NEXT_STATE[self._round_state][action]
 
     def _finish_round(self):
         rewards = self._get_round_rewards()
@@ -91,102 +235,57 @@ class CardsGuessing(Env):
             self._wins[self._opponent] += 1
         if opponent_money < 10:
             self._wins[self._player] += 1
-        previous_cards = {self._player: Guess(self._card[self._opponent]),
-                          self._opponent: Guess(self._card[self._player])}
+        previous_cards = {self._player: _GUESS_OF_CARD[self._card[self._opponent]],
+                          self._opponent: _GUESS_OF_CARD[self._card[self._player]]}
         self._start_new_round(player_money, opponent_money)
         return self._make_first_turn_in_round(rewards, previous_cards)
 
     def _get_round_rewards(self) -> Dict[Player, int]:
-        player_correct = self._card[self._opponent] == self._said[self._player]
-        opponent_correct = self._card[self._player] == self._said[self._opponent]
-        current_money = self._current_money
-        player_spent = self._money[self._player] - current_money[self._player]
-        opponent_spent = self._money[self._opponent] - current_money[self._opponent]
-        bank = player_spent + opponent_spent
-
-        if player_correct and opponent_correct:
-            value = bank / 2
-            p_value = value
-            o_value = value
-        elif player_correct and not opponent_correct:
-            p_value = bank
-            o_value = 0.0
-        elif not player_correct and opponent_correct:
-            p_value = 0.0
-            o_value = bank
-        else:
-            p_value = player_spent
-            o_value = opponent_spent
-        player_reward = p_value - player_spent
-        opponent_reward = o_value - opponent_spent
-        assert player_reward + opponent_reward == 0.0, (player_reward, opponent_reward)
+        player_reward, opponent_reward = PAYOFF[self._round_state]
         return {self._player: player_reward, self._opponent: opponent_reward}
 
-    @staticmethod
-    def _money_spent(steps) -> int:
-        return 10 * sum(s1 == s2 for s1, s2 in zip_longest(steps, steps[1:]))
-
     @property
     def _current_money(self) -> Dict[Player, int]:
-        spent = {p: self._money_spent(self._steps[p]) for p in self._all_players}
+        spent = SPENT[self._round_state]
         return {p: self._money[p] - spent[p] for p in self._all_players}
 
-    @staticmethod
-    def _current_guess(steps) -> Guess:
-        return Guess(steps[-1]) if len(steps) > 0 else Guess.AWAITING_FOR_GUESS
-
     @property
     def _said(self) -> Dict[Player, Guess]:
-        return {p: self._current_guess(self._steps[p]) for p in self._all_players}
+        said = SAID[self._round_state]
+        return {p: said[p] for p in self._all_players}
 
     def _step(self, action: int):
         assert not self._is_done()
-        action = Card(action)
-        self._steps[self._player].append(action)
-
-        passed = self._passed
+        self._append_step(self._player, _CARDS[action])
 
-        if not passed[self._player] and not passed[self._opponent]:
+        phase = PHASE[self._round_state]
+        if phase == RoundPhase.OPPONENT or phase == RoundPhase.OPPONENT_LAST:
             self._make_opponents_turn(reward=0.0, first_turn=False, done=False)
+        if phase == RoundPhase.PLAYER or phase == RoundPhase.OPPONENT:
             return self._get_observation(self._player), 0.0, False, {}
-        elif not passed[self._player] and passed[self._opponent]:
-            return self._get_observation(self._player), 0.0, False, {}
-        elif passed[self._player] and not passed[self._opponent]:
-            self._make_opponents_turn(reward=0.0, first_turn=False, done=False)
-            return self._finish_round()
-        else:
-            return self._finish_round()
+        return self._finish_round()
 
     def _make_opponents_turn(self, reward: float, first_turn: bool, done: bool, previous_cards=None):
         opp_state = self._get_observation(self._opponent, first_turn, previous_cards), reward, done, {}
         self._opponent_agent.observe(*opp_state)
-        opp_action = Card(self._opponent_agent.act())
-        self._steps[self._opponent].append(opp_action)
+        self._append_step(self._opponent, _CARDS[self._opponent_agent.act()])
 
     def _get_observation(self, player: Player, first_turn=False, previous_cards=None):
+        if not first_turn and previous_cards is None:
+            return OBSERVATIONS[self._round_state][player]
         if previous_cards is None:
             previous_cards = {p: Guess.AWAITING_FOR_GUESS for p in self._all_players}
         opponent = self._get_other_player(player)
-        return FirstTurnInRound(int(first_turn)), self._card[player], self._said[opponent], previous_cards[player]
+        first_turn = FirstTurnInRound.YES if first_turn else FirstTurnInRound.NO
+        return first_turn, self._card[player], SAID[self._round_state][opponent], previous_cards[player]
 
     def _get_other_player(self, player):
         return self._player if player == self._opponent else self._opponent
 
     @property
     def _passed(self) -> Dict[Player, bool]:
-        passed = {self._player: False, self._opponent: False}
-        current_money = self._current_money
-        for p in self._all_players:
-            if current_money[p] < 10:
-                passed[p] = True
-
-            if len(self._steps[p]) >= 2 and self._steps[p][-1] == self._steps[p][-2]:
-                passed[p] = True
-
-        passed_due_to_other = {p: passed[o] and len(self._steps[p]) == len(self._steps[o]) for p, o
-                               in ((p, self._get_other_player(p)) for p in self._all_players)}
-
-        return {p: passed[p] or passed_due_to_other[p] for p in self._all_players}
+        passed = PASSED[self._round_state]
+        return {p: passed[p] for p in self._all_players}
 
     def _is_done(self):
         return any(self._money[p] < 10 for p in self._all_players)
@@ -219,6 +318,49 @@ class CardsGuessing(Env):
         previous_cards = {p: Guess.AWAITING_FOR_GUESS for p in self._all_players}
         return self._make_first_turn_in_round(rewards, previous_cards)
 
+    def round_moves(self, player: Player) -> int:
+        """
+        Number of moves player made in the current round
+        """
+        return len(self._steps[player])
+
+    def snapshot(self) -> EnvSnapshot:
+        """
+        Immutable copy of the game position, the opponent agent and the random stream are not a part of it
+        """
+        players = self._all_players
+        return EnvSnapshot(card=tuple(self._card[p] for p in players),
+                           money=tuple(self._money[p] for p in players),
+                           steps=tuple(tuple(self._steps[p]) for p in players),
+                           starting_player=self._starting_player,
+                           wins=tuple(self._wins[p] for p in players),
+                           round_state=self._round_state)
+
+    def restore(self, snapshot: EnvSnapshot) -> None:
+        players = self._all_players
+        self._card = dict(zip(players, snapshot.card))
+        self._money = dict(zip(players, snapshot.money))
+        self._steps = {p: list(steps) for p, steps in zip(players, snapshot.steps)}
+        self._starting_player = snapshot.starting_player
+        self._wins = dict(zip(players, snapshot.wins))
+        self._round_state = snapshot.round_state
+
+    def clone(self, opponent=None, seed=None) -> 'CardsGuessing':
+        """
+        Copy of the env at the current position for lookahead. It plays against opponent (set to the clone's env)
+        or shares the current opponent agent, and deals future rounds from its own random stream.
+        """
+        # bypasses Env.__new__, a clone is not registered for closing
+        clone = object.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        clone._closed = True
+        clone._random = random.Random(seed)
+        clone.restore(self.snapshot())
+        if opponent is not None:
+            clone._opponent_agent = opponent
+            opponent.set_env(clone)
+        return clone
+
     def _render(self, mode='human', close=False):
         if close:
             return
@@ -269,4 +411,5 @@ class CardsGuessing(Env):
 
 
     def _seed(self, seed=None):
-        random.seed(seed)
+        self._random.seed(seed)
+        return [seed]
@@ -0,0 +1,127 @@
+import math
+import random
+from collections import namedtuple
+
+from casino import Game, Player
+
+
+Evaluation = namedtuple("Evaluation", "games wins1 wins2 draws win_rate win_rate_ci mean_reward mean_reward_ci "
+                                      "decision better")
+
+
+class RunningStats(object):
+    """
+    Welford's running mean and variance
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self) -> float:
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def ci(self, z: float = 1.96) -> float:
+        return z * math.sqrt(self.variance / self.count) if self.count > 0 else float("inf")
+
+
+class SequentialTest(object):
+    """
+    Sobel-Wald three decision test on decisive games, two one-sided SPRTs of
+    p = 0.5 against p = 0.5 + delta and against p = 0.5 - delta, p is the chance of player1 to win a game.
+    alpha is the chance to call either player better when they are equal, split in halves between the two SPRTs,
+    beta the chance to miss a difference of delta.
+    """
+    PLAYER1 = 1
+    PLAYER2 = 2
+    EQUAL = 0
+
+    def __init__(self, delta: float = 0.05, alpha: float = 0.05, beta: float = 0.05):
+        self.llr_player1 = 0.0
+        self.llr_player2 = 0.0
+        self._better = math.log((0.5 + delta) / 0.5)
+        self._worse = math.log((0.5 - delta) / 0.5)
+        self._upper = math.log((1 - beta) / (alpha / 2))
+        self._lower = math.log(beta / (1 - alpha / 2))
+
+    def add(self, player1_won: bool) -> None:
+        if player1_won:
+            self.llr_player1 += self._better
+            self.llr_player2 += self._worse
+        else:
+            self.llr_player1 += self._worse
+            self.llr_player2 += self._better
+
+    @property
+    def decision(self):
+        """
+        PLAYER1 or PLAYER2 when one is better, EQUAL when neither is by delta, None while undecided
+        """
+        if self.llr_player1 >= self._upper:
+            return self.PLAYER1
+        if self.llr_player2 >= self._upper:
+            return self.PLAYER2
+        if self.llr_player1 <= self._lower and self.llr_player2 <= self._lower:
+            return self.EQUAL
+        return None
+
+
+def evaluate(player1: Player, player2: Player, money: int = 100, rounds: int = 1000, delta: float = 0.05,
+             confidence: float = 0.95, max_games: int = 100000, min_games: int = 10, seed: int = None,
+             z: float = 1.96) -> Evaluation:
+    """
+    Plays Games of player1 against player2 until SequentialTest decides at the given confidence whether
+    one of them wins more often by delta (or max_games are played, then decision is None): equal players are
+    called different with probability 1 - confidence at most, a difference of delta is missed with the same.
+    Reward is player1's money change in a game, a game reaching the rounds limit is a draw and is not tested.
+    """
+    if seed is not None:
+        random.seed(seed)
+    test = SequentialTest(delta, 1 - confidence, 1 - confidence)
+    wins = RunningStats()
+    rewards = RunningStats()
+    wins1 = wins2 = draws = 0
+    games = 0
+    while games < max_games:
+        game = Game(player1, money, player2, money, rounds)
+        winner = game.run()
+        games += 1
+        rewards.add(game.current_money[player1] - money)
+        if winner is None:
+            draws += 1
+        else:
+            wins.add(winner is player1)
+            test.add(winner is player1)
+            if winner is player1:
+                wins1 += 1
+            else:
+                wins2 += 1
+        if games >= min_games and test.decision is not None:
+            break
+
+    return Evaluation(games=games,
+                      wins1=wins1,
+                      wins2=wins2,
+                      draws=draws,
+                      win_rate=wins.mean,
+                      win_rate_ci=wins.ci(z),
+                      mean_reward=rewards.mean,
+                      mean_reward_ci=rewards.ci(z),
+                      decision=test.decision,
+                      better={test.PLAYER1: player1, test.PLAYER2: player2}.get(test.decision))
+
+
+if __name__ == "__main__":
+    from ilariia import B1V1, BlackBot
+
+    result = evaluate(B1V1(), BlackBot(), seed=0)
+    print("Decided after %s games, better: %s, win rate %.3f±%.3f, mean reward %.1f±%.1f" % (
+        result.games, result.better.name if result.better else None, result.win_rate, result.win_rate_ci,
+        result.mean_reward, result.mean_reward_ci))
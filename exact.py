@@ -0,0 +1,191 @@
+from collections import namedtuple, defaultdict
+from itertools import product
+
+import casino
+from env import Card, Guess, Player, ROUND_KERNEL, MOVER, NEXT_STATE, PAYOFF, NO_PREVIOUS, mover_observation
+
+
+# probability of the ordered (player card, opponent card) pairs of random.sample(RED, RED, BLACK, BLACK, 2)
+DEALS = {(card1, card2): (1 if card1 == card2 else 2) / 6 for card1, card2 in product(Card, Card)}
+
+RoundOutcome = namedtuple("RoundOutcome", "probability cards starting_player steps reward following")
+EpisodeValue = namedtuple("EpisodeValue", "value win_probability finished_probability length")
+
+
+class ProbedPolicy(object):
+    """
+    act() of a bot as a function of the observation, every observation is asked once and remembered.
+    Exact only for bots whose action depends on the observation alone.
+    """
+    def __init__(self, bot):
+        self.bot = bot
+        self.actions = {}
+
+    def __call__(self, observation) -> int:
+        observation = tuple(int(value) for value in observation)
+        action = self.actions.get(observation)
+        if action is None:
+            self.bot.observe(observation, 0.0, False, {})
+            action = self.actions[observation] = int(self.bot.act())
+        return action
+
+
+class ExactEvaluator(object):
+    """
+    Expected results of CardsGuessing between two deterministic bots (the player and the env's opponent)
+    by enumerating the deals and starting players instead of sampling them.
+
+    The only thing a round passes on to the next one besides money are the previous cards in the first
+    observations, so rounds are played out once per previous cards and episodes are a distribution
+    over (steps, money, previous cards) pushed forward a round at a time.
+    """
+    def __init__(self, player, opponent):
+        self.policies = (ProbedPolicy(player), ProbedPolicy(opponent))
+        self._outcomes = {}
+        self._transitions = {}
+
+    def _play_round(self, cards: tuple, starting_player: Player, previous: tuple) -> (int, float):
+        state = ROUND_KERNEL.initial[cards + (starting_player,)]
+        moved = [False, False]
+        steps = 0
+        while MOVER[state] is not None:
+            mover = MOVER[state]
+            observation = mover_observation(state, not moved[mover], previous)
+            moved[mover] = True
+            steps += mover == Player.PLAYER
+            state = NEXT_STATE[state][self.policies[mover](observation)]
+        return steps, PAYOFF[state][Player.PLAYER]
+
+    def round_outcomes(self, previous: tuple = NO_PREVIOUS) -> list:
+        """
+        Every way a round can go after the given previous cards (of the player, of the opponent),
+        steps are the player's moves and following the previous cards of the next round
+        """
+        previous = tuple(previous)
+        outcomes = self._outcomes.get(previous)
+        if outcomes is None:
+            outcomes = self._outcomes[previous] = [
+                RoundOutcome(probability / 2, cards, starting_player,
+                             *self._play_round(cards, starting_player, previous), (Guess(cards[1]), Guess(cards[0])))
+                for cards, probability in DEALS.items() for starting_player in Player]
+        return outcomes
+
+    def _round_transitions(self, previous: tuple) -> list:
+        # round outcomes that lead to the same position merged
+        transitions = self._transitions.get(previous)
+        if transitions is None:
+            merged = defaultdict(float)
+            for outcome in self.round_outcomes(previous):
+                merged[(outcome.steps, outcome.reward, outcome.following)] += outcome.probability
+            transitions = self._transitions[previous] = [key + (probability,) for key, probability in merged.items()]
+        return transitions
+
+    def round_payoffs(self, previous: tuple = None) -> dict:
+        """
+        Distribution of the player's round reward, the first round of an episode for previous=NO_PREVIOUS,
+        any later one when previous is None
+        """
+        if previous is None:
+            weighted = [(probability, (Guess(card2), Guess(card1))) for (card1, card2), probability in DEALS.items()]
+        else:
+            weighted = [(1.0, tuple(previous))]
+        payoffs = defaultdict(float)
+        for weight, previous_cards in weighted:
+            for outcome in self.round_outcomes(previous_cards):
+                payoffs[outcome.reward] += weight * outcome.probability
+        return dict(payoffs)
+
+    def round_value(self, previous: tuple = None) -> float:
+        return sum(reward * probability for reward, probability in self.round_payoffs(previous).items())
+
+    def episode(self, starting_money: int = 100, max_episode_steps: int = 1000) -> EpisodeValue:
+        """
+        Expected reward and steps of an episode played with Bot.run under TimeLimit(max_episode_steps),
+        win_probability is the chance of a positive reward as counted by RunResult.wins, finished_probability
+        the chance that someone runs out of money before the time limit
+        """
+        by_steps = [defaultdict(float) for _ in range(max_episode_steps + 1)]
+        by_steps[0][(starting_money, NO_PREVIOUS)] = 1.0
+        value = win = finished = length = 0.0
+
+        def end(probability, money, steps):
+            nonlocal value, win, length
+            value += probability * (money - starting_money)
+            win += probability * (money > starting_money)
+            length += probability * steps
+
+        for steps in range(max_episode_steps + 1):
+            positions, by_steps[steps] = by_steps[steps], None
+            for (money, previous), probability in positions.items():
+                if steps == max_episode_steps:
+                    end(probability, money, steps)
+                    continue
+                for round_steps, reward, following, round_probability in self._round_transitions(previous):
+                    p = probability * round_probability
+                    round_end = steps + round_steps
+                    if round_end > max_episode_steps:
+                        # cut in the middle of the round, which had not paid yet
+                        end(p, money, max_episode_steps)
+                        continue
+                    after = money + reward
+                    if after < 10 or 2 * starting_money - after < 10:
+                        finished += p
+                        end(p, after, round_end)
+                    else:
+                        by_steps[round_end][(after, following)] += p
+        return EpisodeValue(value=value, win_probability=win, finished_probability=finished, length=length)
+
+
+_CASINO_CARDS = {Card.RED: casino.Card.RED, Card.BLACK: casino.Card.BLACK}
+
+
+def casino_game(player1: casino.Player, player2: casino.Player, money: int = 100, rounds: int = 1000) -> EpisodeValue:
+    """
+    Exact result of casino.Game between two players that decide from the current round alone.
+    Every distinct round (first player, cards, money of both) is played once with GameRound,
+    the game is the distribution of player1's money pushed forward a round at a time.
+    value is player1's expected money change, win_probability the chance that Game.run returns player1,
+    length the expected number of rounds.
+    """
+    outcomes = {}
+
+    def play(first_is_player1: bool, cards: tuple, money1: int) -> float:
+        key = (first_is_player1, cards, money1)
+        value1 = outcomes.get(key)
+        if value1 is None:
+            first, second = (player1, player2) if first_is_player1 else (player2, player1)
+            first_money, second_money = (money1, 2 * money - money1) if first_is_player1 else \
+                (2 * money - money1, money1)
+            value = casino.GameRound(first, first_money, second, second_money,
+                                     cards=tuple(_CASINO_CARDS[card] for card in cards)).play()[0]
+            value1 = outcomes[key] = value if first_is_player1 else -value
+        return value1
+
+    positions = {money: 1.0}
+    value = win = finished = length = 0.0
+    for i in range(rounds):
+        following = defaultdict(float)
+        for money1, probability in positions.items():
+            for cards, deal_probability in DEALS.items():
+                p = probability * deal_probability
+                after = money1 + play(i % 2 == 0, cards, money1)
+                if after < 10 or 2 * money - after < 10:
+                    finished += p
+                    win += p * (after >= 10)
+                    value += p * (after - money)
+                    length += p * (i + 1)
+                else:
+                    following[after] += p
+        positions = following
+    for money1, probability in positions.items():
+        value += probability * (money1 - money)
+        length += probability * rounds
+    return EpisodeValue(value=value, win_probability=win, finished_probability=finished, length=length)
+
+
+if __name__ == "__main__":
+    from bots import IlariiaB1V1Bot, SmarterBaselineBot
+    from ilariia import B1V1, BlackBot
+
+    print(ExactEvaluator(IlariiaB1V1Bot(), SmarterBaselineBot()).episode())
+    print(casino_game(B1V1(), BlackBot()))
@@ -0,0 +1,95 @@
+import pickle
+from collections import namedtuple
+
+import numpy as np
+
+from cfr import GameTree, best_response, frozen_table
+from env import Player, NO_PREVIOUS, mover_observation
+
+
+BestResponse = namedtuple("BestResponse", "value bot_value table probes")
+
+
+def _pickled(bot) -> bytes:
+    # everything the bot could learn into is copied, the env is not
+    env, bot.env = bot.env, None
+    try:
+        return pickle.dumps(bot, pickle.HIGHEST_PROTOCOL)
+    finally:
+        bot.env = env
+
+
+def _unpickled(pickled: bytes, env):
+    bot = pickle.loads(pickled)
+    bot.env = env
+    return bot
+
+
+def probe(tree: GameTree, bot, side: Player, samples: int = 1, previous: tuple = NO_PREVIOUS) -> (np.ndarray, int):
+    """
+    Strategy of bot playing side at every node of tree where it moves, found by walking the rounds with (pickled)
+    copies of the bot that observe what the env would show them and act. Each node asks samples copies,
+    the share of copies saying a card is its probability and the walk goes on with one copy per said card,
+    so cards a bot never says are not explored. Returns the node strategy and the number of act() calls.
+    """
+    node_strategy = np.full((len(tree), 2), 0.5)
+    mover, children, states = tree.mover.tolist(), tree.children.tolist(), tree.state.tolist()
+    probes = 0
+    start, stop = tree.levels[0]
+    env = bot.env
+    stack = [(n, _pickled(bot), False) for n in range(start, stop)]
+    while stack:
+        n, walker, moved = stack.pop()
+        if mover[n] < 0:
+            continue
+        if mover[n] != side:
+            stack.extend((child, walker, moved) for child in children[n])
+            continue
+        observation = mover_observation(states[n], not moved, previous)
+        following = {}
+        counts = [0, 0]
+        for _ in range(samples):
+            sample = _unpickled(walker, env)
+            sample.observe(observation, 0.0, False, {})
+            action = int(sample.act())
+            counts[action] += 1
+            if action not in following:
+                following[action] = _pickled(sample)
+            probes += 1
+        node_strategy[n] = (counts[0] / samples, counts[1] / samples)
+        for action, pickled in following.items():
+            stack.append((children[n][action], pickled, True))
+    return node_strategy, probes
+
+
+def exploit(bot, side: Player = Player.OPPONENT, tree: GameTree = None, samples: int = 1,
+            previous: tuple = NO_PREVIOUS, max_moves: int = 10, bot_max_moves: int = 30) -> BestResponse:
+    """
+    Exact best response to bot playing side in one round of CardsGuessing, with the bot's learning frozen.
+    value is the best response's expected round reward, bot_value the bot's reward against it and table
+    the exploiting policy for bots.TableBot on the other side. Stochastic bots are estimated from samples
+    copies per decision, deterministic ones are exact with samples=1.
+    The best response moves at most max_moves times a round as TableBot does, the bot is cut only after
+    bot_max_moves so that the tree follows its own way of ending rounds.
+    """
+    if tree is None:
+        tree = GameTree((max_moves, bot_max_moves) if side == Player.OPPONENT else (bot_max_moves, max_moves))
+    node_strategy, probes = probe(tree, bot, side, samples, previous)
+    exploiter = Player(1 - side)
+    value, policy = best_response(tree, exploiter, node_strategy)
+    values = np.zeros((len(tree.tables[exploiter]), 2))
+    for position, action in policy.items():
+        values[position, action] = 1.0
+    table = frozen_table(tree.tables[exploiter], values)
+    return BestResponse(value=value, bot_value=-value, table=table, probes=probes)
+
+
+if __name__ == "__main__":
+    import time
+    from bots import BOTS
+
+    for name, samples in (("SmarterBaselineBot", 1), ("BlackBot", 1), ("IlariiaB1V1Bot", 1), ("MishaBotV1New", 50)):
+        start = time.time()
+        result = exploit(BOTS[name](), samples=samples)
+        print("%s: best response wins %.3f a round, %d probes, %.0f ms" % (
+            name, result.value, result.probes, 1000 * (time.time() - start)))
@@ -1,11 +1,21 @@
 import random
-from storage import Storage, StorageRow, list_sequence
+from itertools import zip_longest
+
+from storage import Storage, StorageRow
 from casino import Player, Card
+from trie import PrefixTrie
+import checkpoint
+
+_SYMBOLS = (None, Card.RED, Card.BLACK)
 
 
 class IlariiaPlayer(Player):
-    def __init__(self):
-        self.storage = Storage()
+    """
+    Keeps every round it played in storage, a memory-mapped Storage in the storage_path directory if given,
+    which then carries the history over to later runs
+    """
+    def __init__(self, storage_path: str = None):
+        self.storage = Storage(storage_path)
         self.my = []
         self.opponent = []
         self.my_card = None
@@ -104,32 +114,52 @@ class B1V1(IlariiaPlayer):
 
 
 class B1V2(IlariiaPlayer):
-    def __init__(self, learning_time):
-        super(B1V2, self).__init__()
+    def __init__(self, learning_time, max_nodes=None, decay=1.0, storage_path: str = None):
+        super(B1V2, self).__init__(storage_path)
         self.counter = 0
         self.learning_time = learning_time
-        self.historic_base = {}
+        self.historic_base = PrefixTrie(max_nodes, decay)
+        self._node = None  # node of my card and the complete (my, opponent) move pairs of the round
+        self._pairs = -1
 
     @property
     def name(self) -> str:
         return "IlariiaUltimatum"
 
+    def reset(self):
+        super(B1V2, self).reset()
+        self._node = None
+        self._pairs = -1
+
+    def save(self, path: str) -> None:
+        self.historic_base.save(path, _SYMBOLS, counter=self.counter)
+
+    def load(self, path: str) -> None:
+        saved = checkpoint.load(path, "PrefixTrie")
+        self.historic_base = PrefixTrie.from_checkpoint(saved, _SYMBOLS)
+        self.counter = saved.attributes["counter"]
+        self._node = None
+        self._pairs = -1
+
     def _learn_strategy(self) -> Card:
         if self.opponent:
             return self.switch_card(self.opponent[-1])
         return self.switch_card(self.my_card)
 
     def _historic_base_strategy(self) -> Card:
-
-        sequence = list_sequence(self.my, self.opponent)
-
-        choose_red = tuple([self.my_card] + sequence + [Card.RED])
-        choose_black = tuple([self.my_card] + sequence + [Card.BLACK])
-
-        M_red, C_red = self.historic_base.get(choose_red, (0, 1))
-        M_black, C_black = self.historic_base.get(choose_black, (0, 1))
-
-        if M_red / C_red > M_black/C_black:
+        # the historic base does not change during a round, so the walk is continued from the last decision
+        base = self.historic_base
+        if self._pairs < 0:
+            self._node = base.child(base.ROOT, self.my_card)
+            self._pairs = 0
+        while self._pairs < min(len(self.my), len(self.opponent)):
+            self._node = base.child(base.child(self._node, self.my[self._pairs]), self.opponent[self._pairs])
+            self._pairs += 1
+        node = self._node
+        for my, opponent in zip_longest(self.my[self._pairs:], self.opponent[self._pairs:]):
+            node = base.child(base.child(node, my), opponent)
+
+        if base.mean(base.child(node, Card.RED)) > base.mean(base.child(node, Card.BLACK)):
             return Card.RED
         else:
             return Card.BLACK
@@ -143,16 +173,16 @@ class B1V2(IlariiaPlayer):
 
     def win(self, value) -> None:
         self.value = value
-        sequence = list_sequence(self.my, self.opponent)
-        i = 0
-        while i < len(sequence):
-            key = tuple([self.my_card] + sequence[: (i + 1)])
-            if key not in self.historic_base:
-                new_value = (value, 1)
-            else:
-                new_value = (self.historic_base[key][0] + value, self.historic_base[key][1] + 1)
-            self.historic_base[key] = new_value
-            i += 2
+        # every prefix of the round ending with my move is counted, one node per move
+        base = self.historic_base
+        node = base.add_child(base.ROOT, self.my_card)
+        for i, (my, opponent) in enumerate(zip_longest(self.my, self.opponent)):
+            if i:
+                node = base.add_child(node, previous)
+            node = base.add_child(node, my)
+            base.add(node, value)
+            previous = opponent
+        base.tick()
 
 
 class B1V3(B1V2):
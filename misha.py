@@ -3,9 +3,12 @@ from itertools import product
 import random
 from pprint import pprint
 
+from bayes import ANY, CardCounts
 from casino import Player, Card
 
 RoundHistory = namedtuple("RoundHistory", "my_card opp_said_card changed opp_card")
+_CARDS = (Card.RED, Card.BLACK)
+_CARD_INDEX = {Card.RED: 0, Card.BLACK: 1, None: ANY}
 
 
 class MishaBotV1(Player):
@@ -15,21 +18,24 @@ class MishaBotV1(Player):
         self._op_said_card: Card = None
         self._op_changed_card: bool = None
         self._apriori = apriori
-        self.marginal_counters = self._init_counters(apriori)
-        self._number_of_rounds = len(self.marginal_counters) * apriori
+        self.counts = CardCounts(apriori)
 
-    @staticmethod
-    def _init_counters(apriori):
-        mycard = [Card.RED, Card.BLACK]
-        opsaid = [Card.RED, Card.BLACK]
-        changed = [True, False]
-        opcard = [Card.RED, Card.BLACK]
-        return {RoundHistory(*i): apriori for i in product(mycard, opsaid, changed, opcard)}
+    @property
+    def marginal_counters(self):
+        return {RoundHistory(*history): int(self.counts.counts[_CARD_INDEX[history[0]], _CARD_INDEX[history[1]],
+                                                               int(history[2]), _CARD_INDEX[history[3]]])
+                for history in product(_CARDS, _CARDS, (True, False), _CARDS)}
 
     @property
     def name(self) -> str:
         return self.__class__.__name__
 
+    def save(self, path: str) -> None:
+        self.counts.save(path)
+
+    def load(self, path: str, mmap: bool = False) -> None:
+        self.counts = CardCounts.load(path, mmap)
+
     def take_card(self, card: Card) -> None:
         self._my_card = card
 
@@ -65,30 +71,9 @@ class MishaBotV1(Player):
         return self._my_said_card
 
     def _p_opcard_cond_all(self, opcard):
-        p_all_marg = self._marg_p(mycard=self._my_card, opsaid=self._op_said_card, changed=self._op_changed_card)
-        p_all_cond_opcard = self._cond_p(opcard=opcard, mycard=self._my_card,
-                                         opsaid=self._op_said_card, changed=self._op_changed_card)
-        p_opcard_cond_all = 0.5 * p_all_cond_opcard / p_all_marg
-        return p_opcard_cond_all
-
-    def _marg_p(self, mycard=None, opsaid=None, changed=None, opcard=None):
-        mycard = [Card.RED, Card.BLACK] if mycard is None else [mycard]
-        opsaid = [Card.RED, Card.BLACK] if opsaid is None else [opsaid]
-        changed = [True, False] if changed is None else [changed]
-        opcard = [Card.RED, Card.BLACK] if opcard is None else [opcard]
-        counter = sum(self.marginal_counters[RoundHistory(*i)] for i in product(mycard, opsaid, changed, opcard))
-        return counter / self._number_of_rounds
-
-    def _cond_p(self, opcard, mycard, opsaid=None, changed=None):
-        opsaid = [Card.RED, Card.BLACK] if opsaid is None else [opsaid]
-        changed = [True, False] if changed is None else [changed]
-        mycard = [mycard]
-        total = sum(self.marginal_counters[RoundHistory(*i)] for i in product([Card.RED, Card.BLACK],
-                                                                              [Card.RED, Card.BLACK],
-                                                                              [True, False],
-                                                                              [opcard]))
-        count = sum(self.marginal_counters[RoundHistory(*i)] for i in product(mycard, opsaid, changed, [opcard]))
-        return count / total
+        changed = ANY if self._op_changed_card is None else int(self._op_changed_card)
+        return self.counts.probability(_CARD_INDEX[self._my_card], _CARD_INDEX[self._op_said_card], changed,
+                                       _CARD_INDEX[opcard])
 
     def end_round(self) -> None:
         self._op_said_card = None
@@ -98,9 +83,7 @@ class MishaBotV1(Player):
 
     def opponent_card(self, card) -> None:
         changed = False if self._op_changed_card is None else self._op_changed_card
-        history = RoundHistory(self._my_card, self._op_said_card, changed, card)
-        self.marginal_counters[history] += 1
-        self._number_of_rounds += 1
+        self.counts.add(_CARD_INDEX[self._my_card], _CARD_INDEX[self._op_said_card], changed, _CARD_INDEX[card])
 
     def opponent_change_card(self, is_changed: bool) -> None:
         if is_changed:
@@ -0,0 +1,13 @@
+import numpy as np
+
+
+NPY_HEADER_SIZE = 256  # fixed so the row count can be rewritten in place
+
+
+def npy_header(dtype: np.dtype, rows: int) -> bytes:
+    """
+    Version 1.0 .npy header of a one-dimensional array of rows, padded to NPY_HEADER_SIZE bytes
+    """
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (np.lib.format.dtype_to_descr(dtype), rows)
+    header = header.ljust(NPY_HEADER_SIZE - 10 - 1) + "\n"
+    return b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little") + header.encode("latin1")
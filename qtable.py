@@ -0,0 +1,140 @@
+import numpy as np
+
+import checkpoint
+
+
+class QTable(object):
+    """
+    Q values of event sequences. Sequences are interned to dense state ids as they are first seen,
+    the successor of a state by an event is found in a transition table, so a trajectory is a list of ids.
+    Values are rows of a growable array, one column per action, unseen pairs are worth 0.
+    """
+    ROOT = 0
+
+    def __init__(self, events: int = 4, actions: int = 2, capacity: int = 1024):
+        self.events = events
+        self.actions = actions
+        self.size = 1
+        capacity = max(capacity, 1)
+        self.transitions = np.full((capacity, events), -1, dtype=np.int64)  # successor by event, -1 if not seen yet
+        self.parent = np.full(capacity, -1, dtype=np.int64)
+        self.event = np.full(capacity, -1, dtype=np.int64)
+        self.values = np.zeros((capacity, actions), dtype=np.float64)
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self) -> None:
+        capacity = 2 * len(self.values)
+        for name, fill in (("transitions", -1), ("parent", -1), ("event", -1), ("values", 0.0)):
+            old = getattr(self, name)
+            new = np.full((capacity,) + old.shape[1:], fill, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def next(self, state: int, event: int) -> int:
+        following = int(self.transitions[state, event])
+        if following < 0:
+            if self.size == len(self.values):
+                self._grow()
+            following = self.size
+            self.size += 1
+            self.transitions[state, event] = following
+            self.parent[following] = state
+            self.event[following] = event
+        return following
+
+    def next_batch(self, states: np.ndarray, events: np.ndarray) -> np.ndarray:
+        """
+        next of many states at once, only states not seen before are interned one by one
+        """
+        following = self.transitions[states, events]
+        for i in np.flatnonzero(following < 0):
+            following[i] = self.next(states[i], events[i])
+        return following
+
+    def greedy(self, state: int) -> int:
+        # ties go to the last action as with max over (value, action) pairs
+        return max(zip(self.values[state].tolist(), range(self.actions)))[1]
+
+    def greedy_batch(self, states: np.ndarray) -> np.ndarray:
+        return self.actions - 1 - np.argmax(self.values[states, ::-1], axis=1)
+
+    def update(self, states, actions, reward: float, alpha: float, discount: float) -> None:
+        """
+        Moves Q of every (state, action) of a trajectory towards the reward discounted from its end
+        """
+        values = self.values
+        for i in range(len(states) - 1, -1, -1):
+            state, action = states[i], actions[i]
+            values[state, action] = (1.0 - alpha) * values[state, action] + alpha * reward
+            reward *= discount
+
+    def update_batch(self, states: np.ndarray, actions: np.ndarray, targets: np.ndarray, alpha: float) -> None:
+        """
+        Same as moving Q towards targets one by one in the given order: a pair updated n times in the batch
+        ends at (1 - alpha)^n Q + sum of alpha (1 - alpha)^(updates after it) target
+        """
+        if len(states) == 0:
+            return
+        keys = states * self.actions + actions
+        order = np.argsort(keys, kind="mergesort")
+        keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        counts = np.diff(np.r_[starts, len(keys)])
+        later = np.repeat(starts + counts, counts) - np.arange(len(keys)) - 1
+        sums = np.add.reduceat(alpha * (1.0 - alpha) ** later * targets[order], starts)
+        values = self.values.reshape(-1)
+        keys = keys[starts]
+        values[keys] = (1.0 - alpha) ** counts * values[keys] + sums
+
+    def lambda_returns(self, states: np.ndarray, rounds: np.ndarray, rewards: np.ndarray, discount: float,
+                       lam: float = 1.0) -> np.ndarray:
+        """
+        Targets of the steps of whole rounds laid out one round after another, rounds[i] is the round of step i
+        and rewards the reward of every round. The last step of a round gets its reward, an earlier one
+        discount * ((1 - lam) * max Q(next state) + lam * target of the next step), lam=1 is the discounted reward
+        the bots learn from.
+        """
+        targets = rewards[rounds].astype(np.float64)
+        ends = np.flatnonzero(np.r_[rounds[1:] != rounds[:-1], True])
+        starts = np.r_[0, ends[:-1] + 1]
+        from_end = np.repeat(ends, ends - starts + 1) - np.arange(len(rounds))
+        bootstrap = self.values[states].max(axis=1)
+        for k in range(1, int(from_end.max()) + 1 if len(rounds) else 0):
+            steps = np.flatnonzero(from_end == k)
+            targets[steps] = discount * ((1.0 - lam) * bootstrap[steps + 1] + lam * targets[steps + 1])
+        return targets
+
+    def save(self, path: str, **attributes) -> None:
+        checkpoint.save(path, "QTable", {name: getattr(self, name)[:self.size]
+                                         for name in ("transitions", "parent", "event", "values")},
+                        events=self.events, actions=self.actions, **attributes)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = False) -> "QTable":
+        """
+        With mmap the arrays map the file copy-on-write until the table grows
+        """
+        saved = checkpoint.load(path, "QTable", mmap)
+        table = cls(saved.attributes["events"], saved.attributes["actions"], capacity=1)
+        for name, array in saved.arrays.items():
+            setattr(table, name, array)
+        table.size = len(table.values)
+        return table
+
+    def sequence(self, state: int) -> tuple:
+        events = []
+        while state != self.ROOT:
+            events.append(int(self.event[state]))
+            state = int(self.parent[state])
+        return tuple(reversed(events))
+
+    def items(self):
+        """
+        (event sequence + (action,), value) of the pairs with a value, the keys of the Counter this replaces
+        """
+        for state in range(len(self)):
+            for action in range(self.actions):
+                if self.values[state, action] != 0:
+                    yield self.sequence(state) + (action,), float(self.values[state, action])
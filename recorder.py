@@ -0,0 +1,116 @@
+import os
+
+import numpy as np
+from gym import Wrapper
+
+from npyformat import npy_header
+
+
+# one row per observation the player gets: reset rows have action -1, step rows the action that led to them
+TRAJECTORY_DTYPE = np.dtype([("observation", np.int8, (4,)),
+                             ("action", np.int8),
+                             ("reward", np.float64),
+                             ("done", np.bool_)])
+
+
+class TrajectoryRecorder(Wrapper):
+    """
+    Records everything the player observes into a single .npy file of TRAJECTORY_DTYPE rows.
+    Rows are collected in a preallocated buffer and appended to the file every chunk_size rows,
+    the header is kept up to date so the file can be opened by load_trajectories at any flush.
+    """
+    def __init__(self, env, path: str, chunk_size: int = 1 << 16):
+        super(TrajectoryRecorder, self).__init__(env)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.rows = 0
+        self._buffer = np.zeros(chunk_size, dtype=TRAJECTORY_DTYPE)
+        self._buffered = 0
+        self._file = open(path, "wb")
+        self._file.write(npy_header(TRAJECTORY_DTYPE, 0))
+
+    def _record(self, observation, action, reward, done):
+        if self._buffered == len(self._buffer):
+            self.flush()
+        self._buffer[self._buffered] = (observation, action, reward, done)
+        self._buffered += 1
+
+    def flush(self):
+        self._buffer[:self._buffered].tofile(self._file)
+        self.rows += self._buffered
+        self._buffered = 0
+        self._file.seek(0)
+        self._file.write(npy_header(TRAJECTORY_DTYPE, self.rows))
+        self._file.seek(0, os.SEEK_END)
+        self._file.flush()
+
+    def _reset(self):
+        # CardsGuessing.reset returns the whole (observation, reward, done, info) of the first turn
+        state = self.env.reset()
+        observation, reward, done, info = state
+        self._record(observation, -1, reward, done)
+        return state
+
+    def _step(self, action):
+        observation, reward, done, info = self.env.step(action)
+        self._record(observation, action, reward, done)
+        return observation, reward, done, info
+
+    def _close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+        return super(TrajectoryRecorder, self)._close()
+
+
+class Trajectories(object):
+    """
+    Read-only memory-mapped view of a recorded file, columns and episodes are views without copies
+    """
+    def __init__(self, path: str):
+        self.data = np.load(path, mmap_mode="r")
+        self.episode_starts = np.flatnonzero(self.data["action"] < 0)
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def episodes(self) -> int:
+        return len(self.episode_starts)
+
+    @property
+    def observations(self) -> np.ndarray:
+        return self.data["observation"]
+
+    @property
+    def actions(self) -> np.ndarray:
+        return self.data["action"]
+
+    @property
+    def rewards(self) -> np.ndarray:
+        return self.data["reward"]
+
+    @property
+    def dones(self) -> np.ndarray:
+        return self.data["done"]
+
+    def episode(self, i: int) -> np.ndarray:
+        start = self.episode_starts[i]
+        stop = self.episode_starts[i + 1] if i + 1 < len(self.episode_starts) else len(self.data)
+        return self.data[start:stop]
+
+    def replay(self, bot) -> None:
+        """
+        Feeds the recorded observations to a learning bot as if it had played the recorded actions,
+        which are taken with Bot.take so that bots recording their moves in _act (SarsaBot) learn from them
+        """
+        for observation, action, reward, done in self.data:
+            if action >= 0:
+                bot.take(int(action))
+            bot.observe(tuple(int(o) for o in observation), float(reward), bool(done), {})
+
+
+def load_trajectories(path: str) -> Trajectories:
+    return Trajectories(path)
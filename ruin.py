@@ -0,0 +1,174 @@
+from collections import namedtuple, defaultdict
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import breadth_first_order
+from scipy.sparse.linalg import splu
+
+from env import CardsGuessing, FirstTurnInRound, Guess, Player
+from exact import DEALS
+from seeding import seed_all
+
+
+RoundDistribution = namedtuple("RoundDistribution", "payoffs steps")  # {player's reward: probability}, mean steps
+RuinResult = namedtuple("RuinResult", "win_probability loss_probability rounds steps")
+
+
+def from_evaluator(evaluator) -> RoundDistribution:
+    """
+    Distribution of any round after the first one of an exact.ExactEvaluator, exact for a single round.
+    A RuinChain of it treats rounds as independent, which they are not: the first observations of a round tell
+    the cards of the previous one, so its reward depends on the deal that decided the previous reward.
+    The chain is thus an approximation for bots that look at previous cards, ExactEvaluator.episode follows them.
+    """
+    steps = sum(probability * outcome.probability * outcome.steps
+                for (card1, card2), probability in DEALS.items()
+                for outcome in evaluator.round_outcomes((Guess(card2), Guess(card1))))
+    return RoundDistribution(payoffs=evaluator.round_payoffs(), steps=steps)
+
+
+def estimate(player, opponent, rounds: int = 100000, starting_money: int = 100, bucket_size: int = None,
+             seed: int = None):
+    """
+    Round distribution of two bots measured by playing rounds of CardsGuessing.
+    With bucket_size the distribution is kept per bucket of the player's money at the start of the round and
+    a function of money is returned, buckets without rounds get the distribution of all of them.
+    """
+    env = CardsGuessing(starting_money, opponent)
+    player.set_env(env)
+    seed_all(seed, env, player, opponent)
+    counts = defaultdict(lambda: defaultdict(int))
+    steps = defaultdict(int)
+    played = 0
+    while played < rounds:
+        player.observe(*env.reset())
+        round_steps = 0
+        bucket = 0 if bucket_size is None else starting_money // bucket_size
+        while not player.done and played < rounds:
+            player.observe(*env.step(player.act()))
+            round_steps += 1
+            if player.observation[0] == FirstTurnInRound.YES:
+                counts[bucket][player.reward] += 1
+                steps[bucket] += round_steps
+                played += 1
+                round_steps = 0
+                if bucket_size is not None:
+                    bucket = int(env.snapshot().money[Player.PLAYER]) // bucket_size
+
+    def distribution(bucket_counts, bucket_steps):
+        total = sum(bucket_counts.values())
+        return RoundDistribution(payoffs={reward: count / total for reward, count in bucket_counts.items()},
+                                 steps=bucket_steps / total)
+
+    everything = defaultdict(int)
+    for bucket_counts in counts.values():
+        for reward, count in bucket_counts.items():
+            everything[reward] += count
+    pooled = distribution(everything, sum(steps.values()))
+    if bucket_size is None:
+        return pooled
+    buckets = {bucket: distribution(bucket_counts, steps[bucket]) for bucket, bucket_counts in counts.items()}
+    return lambda money: buckets.get(int(money) // bucket_size, pooled)
+
+
+class RuinChain(object):
+    """
+    An episode of CardsGuessing as an absorbing Markov chain over the player's money: rounds move it by
+    a reward drawn from distribution(money) (a RoundDistribution, or a function of money giving one) until
+    either side has less than 10. Transient states are the money from 10 to total_money - 10 in steps of unit,
+    absorption probabilities and expected rounds and steps of every state solve sparse linear systems.
+    States that can not reach ruin (e.g. every round is a draw) never finish, their rounds are inf.
+    """
+    def __init__(self, distribution, total_money: int, unit: int = 5):
+        self.unit = unit
+        self.total_money = total_money
+        self.money = np.arange(10, total_money - 10 + 1, unit)
+        n = len(self.money)
+        if n == 0:
+            raise ValueError("total money %s leaves no state both sides can play from" % total_money)
+
+        if isinstance(distribution, RoundDistribution):
+            distributions = [distribution] * n
+        else:
+            distributions = [distribution(money) for money in self.money.tolist()]
+        groups = defaultdict(list)
+        for i, d in enumerate(distributions):
+            groups[id(d)].append(i)
+
+        rows, columns, data = [], [], []
+        win = np.zeros(n)
+        loss = np.zeros(n)
+        steps = np.zeros(n)
+        for indexes in groups.values():
+            indexes = np.array(indexes)
+            d = distributions[indexes[0]]
+            steps[indexes] = d.steps
+            for reward, probability in d.payoffs.items():
+                if reward % unit != 0:
+                    raise ValueError("reward %s is not a multiple of unit %s" % (reward, unit))
+                after = self.money[indexes] + int(reward)
+                lost = after < 10
+                won = total_money - after < 10
+                loss[indexes[lost]] += probability
+                win[indexes[won]] += probability
+                moving = ~lost & ~won
+                rows.append(indexes[moving])
+                columns.append((after[moving] - 10) // unit)
+                data.append(np.full(moving.sum(), probability))
+        transitions = sparse.csr_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(columns))),
+                                        shape=(n, n))
+
+        # states that reach ruin, found from an extra node that every state absorbed in one round points to
+        absorbing = np.flatnonzero(win + loss > 0)
+        edges = sparse.csr_matrix((np.ones(transitions.nnz + len(absorbing)),
+                                   (np.concatenate([transitions.indices, np.full(len(absorbing), n)]),
+                                    np.concatenate([np.repeat(np.arange(n), np.diff(transitions.indptr)),
+                                                    absorbing]))),
+                                  shape=(n + 1, n + 1))
+        finishing = np.zeros(n + 1, dtype=bool)
+        finishing[breadth_first_order(edges, n, directed=True, return_predecessors=False)] = True
+        finishing = np.flatnonzero(finishing[:n])
+
+        self.win_probability = np.zeros(n)
+        self.loss_probability = np.zeros(n)
+        self.rounds = np.full(n, np.inf)
+        self.steps = np.full(n, np.inf)
+        if len(finishing):
+            chain = transitions[finishing][:, finishing]
+            solver = splu(sparse.csc_matrix(sparse.identity(len(finishing)) - chain))
+            self.win_probability[finishing] = solver.solve(win[finishing])
+            self.loss_probability[finishing] = solver.solve(loss[finishing])
+            # with a chance to never finish the expected length is infinite
+            certain = finishing[self.win_probability[finishing] + self.loss_probability[finishing] > 1 - 1e-9]
+            if len(certain) == len(finishing):
+                self.rounds[finishing] = solver.solve(np.ones(len(finishing)))
+                self.steps[finishing] = solver.solve(steps[finishing])
+            else:
+                chain = transitions[certain][:, certain]
+                solver = splu(sparse.csc_matrix(sparse.identity(len(certain)) - chain))
+                self.rounds[certain] = solver.solve(np.ones(len(certain)))
+                self.steps[certain] = solver.solve(steps[certain])
+
+    def __getitem__(self, money: int) -> RuinResult:
+        if money < 10 or self.total_money - money < 10 or (money - 10) % self.unit != 0:
+            raise KeyError(money)
+        i = (money - 10) // self.unit
+        return RuinResult(win_probability=float(self.win_probability[i]),
+                          loss_probability=float(self.loss_probability[i]),
+                          rounds=float(self.rounds[i]),
+                          steps=float(self.steps[i]))
+
+
+def ruin(distribution, starting_money: int = 100, unit: int = 5) -> RuinResult:
+    """
+    Win and ruin probability and expected length of an episode without a time limit from starting_money
+    """
+    return RuinChain(distribution, 2 * starting_money, unit)[starting_money]
+
+
+if __name__ == "__main__":
+    from bots import BaselineBot, IlariiaB1V1Bot, SmarterBaselineBot
+    from exact import ExactEvaluator
+
+    print(ruin(from_evaluator(ExactEvaluator(SmarterBaselineBot(), IlariiaB1V1Bot())), 1000000))
+    print(ruin(estimate(BaselineBot(), SmarterBaselineBot(), seed=0), 1000))
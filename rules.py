@@ -0,0 +1,56 @@
+from collections import deque
+
+import numpy as np
+
+
+class RoundKernel(object):
+    """
+    Round state machine compiled into lookup tables.
+
+    Rules describe a round over hashable states:
+        initial_states() -> {key: state}
+        mover(state) -> index of the player to move, None when the round is finished
+        apply(state, action) -> next state, actions are 0 .. actions - 1
+        payoff(state) -> value of a finished round
+    All reachable states are enumerated once and numbered, after that a move is next_state[state][action].
+    """
+    def __init__(self, rules, actions: int = 2):
+        self.rules = rules
+        self.actions = actions
+        self.states = []
+        self.index = {}
+
+        queue = deque()
+        for state in rules.initial_states().values():
+            self._add(state, queue)
+        next_state = []
+        while queue:
+            state = queue.popleft()
+            if rules.mover(state) is None:
+                next_state.append((-1,) * actions)
+            else:
+                next_state.append(tuple(self._add(rules.apply(state, action), queue) for action in range(actions)))
+
+        self.initial = {key: self.index[state] for key, state in rules.initial_states().items()}
+        self.next_state = tuple(next_state)
+        self.mover = self.table(rules.mover)
+        self.payoff = self.table(lambda state: rules.payoff(state) if rules.mover(state) is None else None)
+
+    def _add(self, state, queue) -> int:
+        if state not in self.index:
+            self.index[state] = len(self.states)
+            self.states.append(state)
+            queue.append(state)
+        return self.index[state]
+
+    def __len__(self):
+        return len(self.states)
+
+    def table(self, function) -> tuple:
+        """
+        Precomputes function over all states, indexed by state number
+        """
+        return tuple(function(state) for state in self.states)
+
+    def array(self, function, dtype=np.int64) -> np.ndarray:
+        return np.array(self.table(function), dtype=dtype)
@@ -0,0 +1,52 @@
+import hashlib
+import random
+
+import numpy as np
+
+
+class SeedSequence(object):
+    """
+    Tree of reproducible seeds. Children are derived from the root entropy and their position in the tree,
+    so shard i of a run gets the same streams whatever process plays it and in whatever order.
+    (numpy.random.SeedSequence does the same but needs numpy >= 1.17)
+    """
+    def __init__(self, entropy: int = None, spawn_key: tuple = ()):
+        if entropy is None:
+            entropy = random.SystemRandom().getrandbits(64)
+        self.entropy = entropy
+        self.spawn_key = tuple(spawn_key)
+        self._spawned = 0
+
+    def __repr__(self):
+        return "SeedSequence(entropy=%r, spawn_key=%r)" % (self.entropy, self.spawn_key)
+
+    @property
+    def seed(self) -> int:
+        digest = hashlib.sha256(repr((self.entropy,) + self.spawn_key).encode()).digest()
+        return int.from_bytes(digest[:8], "little")
+
+    def spawn(self, n: int) -> list:
+        children = [SeedSequence(self.entropy, self.spawn_key + (i,))
+                    for i in range(self._spawned, self._spawned + n)]
+        self._spawned += n
+        return children
+
+    def random(self) -> random.Random:
+        return random.Random(self.seed)
+
+    def np_random(self) -> np.random.RandomState:
+        return np_random(self.seed)
+
+
+def np_random(seed: int = None) -> np.random.RandomState:
+    return np.random.RandomState(None if seed is None else seed % 2 ** 32)
+
+
+def seed_all(seed: int, env, *bots) -> None:
+    """
+    Seeds the env and every bot with its own child stream of seed
+    """
+    env_seed, *bot_seeds = SeedSequence(seed).spawn(1 + len(bots))
+    env.seed(env_seed.seed)
+    for bot, bot_seed in zip(bots, bot_seeds):
+        bot.seed(bot_seed.seed)
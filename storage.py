@@ -1,6 +1,17 @@
+import io
+import os
 from collections import namedtuple
 from itertools import zip_longest
 
+import numpy as np
+
+from casino import Card
+from npyformat import NPY_HEADER_SIZE, npy_header
+
+
+_CODE_CARDS = (None, Card.RED, Card.BLACK)
+_CARD_CODES = {card: code for code, card in enumerate(_CODE_CARDS)}
+
 
 def list_sequence(list1, list2):
     sequence = []
@@ -15,32 +26,225 @@ class StorageRow(namedtuple("StorageRow", ["my", "opponent", "my_card", "opponen
     def sequence(self):
         return list_sequence(self.my, self.opponent)
 
+    def write(self, file) -> None:
+        sequence = self.sequence
+        file.write("".join(("I: %s\n" if i % 2 == 0 else "O: %s\n") % event for i, event in enumerate(sequence)))
+        file.write("My guess: %s(%s)\n" % (self.my[-1], self.opponent_card))
+        file.write("Opponent guess: %s(%s)\n" % (self.opponent[-1], self.my_card))
+        file.write("Value: %r\n" % self.value)
+
     def __repr__(self):
-        result = ""
-        for i, event in enumerate(self.sequence):
-            result += ("I: %s\n" if i%2 == 0 else "O: %s\n") % event
+        result = io.StringIO()
+        self.write(result)
+        return result.getvalue()
 
-        result += "My guess: %s(%s)\n" % (self.my[-1], self.opponent_card)
-        result += "Opponent guess: %s(%s)\n" % (self.opponent[-1], self.my_card)
-        result += "Value: %r\n" % self.value
-        return result
 
+class _Column(object):
+    """
+    Typed array growing by doubling. With a path it is a memory-mapped .npy file whose header holds
+    the used length and the spare capacity follows the data, so np.load reads it as is.
+    The header is mapped too and rewritten on every append, so reopening the file sees every value.
+    """
+    def __init__(self, dtype, path: str = None, capacity: int = 1024):
+        self.dtype = np.dtype(dtype)
+        self.path = path
+        self.length = 0
+        if path is not None and os.path.exists(path):
+            with open(path, "rb") as f:
+                np.lib.format.read_magic(f)
+                shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+                assert dtype == self.dtype and f.tell() == NPY_HEADER_SIZE, (path, dtype, f.tell())
+            self.length = shape[0]
+            capacity = (os.path.getsize(path) - NPY_HEADER_SIZE) // self.dtype.itemsize
+        elif path is not None:
+            with open(path, "wb") as f:
+                f.write(npy_header(self.dtype, 0))
+        self._data = None
+        self._header_map = self._header = None
+        self._allocate(max(capacity, self.length, 1))
+        if path is not None:
+            self._header_map = np.memmap(path, dtype=np.uint8, mode="r+", shape=(NPY_HEADER_SIZE,))
+            self._header = memoryview(self._header_map.view(np.ndarray))
+            self._shape_at = npy_header(self.dtype, 0).index(b"'shape': (") + len(b"'shape': (")
 
-class Storage(object):
+    def _allocate(self, capacity: int):
+        if self.path is None:
+            data = np.empty(capacity, dtype=self.dtype)
+            if self._data is not None:
+                data[:self.length] = self._data[:self.length]
+        else:
+            if self._data is not None:
+                self._data.flush()
+            self._data = None
+            with open(self.path, "r+b") as f:
+                f.truncate(NPY_HEADER_SIZE + capacity * self.dtype.itemsize)
+            data = np.memmap(self.path, dtype=self.dtype, mode="r+", offset=NPY_HEADER_SIZE, shape=(capacity,))
+        self._data = data
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._data[:self.length]
+
+    def append(self, value) -> None:
+        if self.length == len(self._data):
+            self._allocate(2 * len(self._data))
+        self._data[self.length] = value
+        self.length += 1
+        self._write_header()
+
+    def extend(self, values) -> None:
+        end = self.length + len(values)
+        if end > len(self._data):
+            self._allocate(max(2 * len(self._data), end))
+        self._data[self.length:end] = values
+        self.length = end
+        self._write_header()
+
+    def _write_header(self) -> None:
+        # only the shape changes and it only gets longer, over the padding spaces of npy_header
+        if self._header is not None:
+            shape = b"%d,), }" % self.length
+            self._header[self._shape_at:self._shape_at + len(shape)] = shape
+
+    def flush(self) -> None:
+        if self.path is not None:
+            self._data.flush()
+            self._header_map.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self._data = self._header_map = self._header = None
+
+
+QueryStats = namedtuple("QueryStats", "count total mean")
+
+
+class StorageIndex(object):
+    """
+    Posting lists of round ids, kept sorted by appending rounds in order, with the count and the value sum
+    of every key: (my card, opponent card, sign of value) codes and every prefix of the move sequence.
+    Both kinds of keys are tuples of small ints, so each index keeps its own stats.
+    """
     def __init__(self):
-        self.result = []
+        self.cards = {}
+        self.prefixes = {}
+        self.card_stats = {}
+        self.prefix_stats = {}
+
+    @staticmethod
+    def _add(index, stats, key, i: int, value: float) -> None:
+        if key not in index:
+            index[key] = _Column(np.int64, capacity=16)
+            stats[key] = [0, 0.0]
+        index[key].append(i)
+        key_stats = stats[key]
+        key_stats[0] += 1
+        key_stats[1] += value
+
+    def add(self, i: int, row: StorageRow) -> None:
+        sign = (row.value > 0) - (row.value < 0)
+        self._add(self.cards, self.card_stats, (_CARD_CODES[row.my_card], _CARD_CODES[row.opponent_card], sign),
+                  i, row.value)
+        prefix = ()
+        for card in row.sequence:
+            prefix += (_CARD_CODES[card],)
+            self._add(self.prefixes, self.prefix_stats, prefix, i, row.value)
+
+
+def _matches(code: int, card) -> bool:
+    return card is None or code == _CARD_CODES[card]
+
+
+class Storage(object):
+    """
+    Columnar history of rounds: cards and values in flat arrays, the move lists of both players
+    concatenated with offset indexes. Rows are rebuilt as StorageRows only when read.
+    With a path the columns are memory-mapped files in that directory, reopening it with Storage(path) gives
+    every saved round back. flush() writes them to disk, close() (or leaving a with block) also unmaps them.
+    Cards are stored as codes of _CODE_CARDS and values as float64.
+    """
+    COLUMNS = (("my_card", np.int8), ("opponent_card", np.int8), ("value", np.float64),
+               ("my_offsets", np.int64), ("my_moves", np.int8),
+               ("opponent_offsets", np.int64), ("opponent_moves", np.int8))
+
+    def __init__(self, path: str = None, capacity: int = 1024):
+        self.path = path
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+        for name, dtype in self.COLUMNS:
+            setattr(self, name, _Column(dtype, None if path is None else os.path.join(path, name + ".npy"), capacity))
+        if not len(self.my_offsets):
+            self.my_offsets.append(0)
+            self.opponent_offsets.append(0)
+        self._index = None
+
+    @property
+    def result(self):
+        return self
+
+    def __len__(self):
+        return len(self.value)
+
+    def _row(self, i: int) -> StorageRow:
+        my_offsets = self.my_offsets.values
+        opponent_offsets = self.opponent_offsets.values
+        my = self.my_moves.values[my_offsets[i]:my_offsets[i + 1]]
+        opponent = self.opponent_moves.values[opponent_offsets[i]:opponent_offsets[i + 1]]
+        return StorageRow([_CODE_CARDS[code] for code in my.tolist()],
+                          [_CODE_CARDS[code] for code in opponent.tolist()],
+                          _CODE_CARDS[self.my_card.values[i]],
+                          _CODE_CARDS[self.opponent_card.values[i]],
+                          float(self.value.values[i]))
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._row(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._row(i)
+
+    def select(self, start: int = 0, stop: int = None, where=None):
+        """
+        Yields (round id, StorageRow) of the rounds in range(start, stop) for which where(row) is true,
+        e.g. select(10000, 10100) or select(where=lambda row: row.value < 0) for the lost rounds
+        """
+        start, stop, _ = slice(start, stop).indices(len(self))
+        for i in range(start, stop):
+            row = self._row(i)
+            if where is None or where(row):
+                yield i, row
+
+    def dump(self, file, start: int = 0, stop: int = None, where=None) -> None:
+        """
+        Writes the selected rounds to a file-like object one by one, in the format of print()
+        """
+        file.write("Storage:\n\n")
+        for i, row in self.select(start, stop, where):
+            self._write_game(file, i, row)
+
+    @staticmethod
+    def _write_game(file, i, row):
+        file.write("Storage round %r:\n" % i)
+        row.write(file)
+        file.write("\n")
 
     def _repr_game(self, i):
-        return "Storage round %r:\n" % i + repr(self.result[i]) + "\n"
+        result = io.StringIO()
+        self._write_game(result, i, self[i])
+        return result.getvalue()
 
     def __repr__(self):
-        storage_str = "Storage:\n\n"
-        for i in range(len(self.result)):
-            storage_str += self._repr_game(i)
-        return storage_str
+        result = io.StringIO()
+        self.dump(result)
+        return result.getvalue()
 
     def __iter__(self):
-        return iter(self.result)
+        return (self._row(i) for i in range(len(self)))
 
     def print(self):
         return repr(self)
@@ -49,4 +253,77 @@ class Storage(object):
         return self._repr_game(game_id)
 
     def save(self, value):
-        self.result.append(value)
+        self.my_card.append(_CARD_CODES[value.my_card])
+        self.opponent_card.append(_CARD_CODES[value.opponent_card])
+        self.value.append(value.value)
+        self.my_moves.extend([_CARD_CODES[card] for card in value.my])
+        self.my_offsets.append(len(self.my_moves))
+        self.opponent_moves.extend([_CARD_CODES[card] for card in value.opponent])
+        self.opponent_offsets.append(len(self.opponent_moves))
+        if self._index is not None:
+            self._index.add(len(self) - 1, value)
+
+    @property
+    def index(self) -> StorageIndex:
+        """
+        Built over the stored rounds on first use and then updated by every save
+        """
+        if self._index is None:
+            self._index = StorageIndex()
+            for i, row in enumerate(self):
+                self._index.add(i, row)
+        return self._index
+
+    def _card_keys(self, my_card, opponent_card, sign):
+        return [key for key in self.index.cards
+                if _matches(key[0], my_card) and _matches(key[1], opponent_card) and sign in (None, key[2])]
+
+    def query(self, my_card: Card = None, opponent_card: Card = None, sign: int = None, prefix=None) -> np.ndarray:
+        """
+        Sorted ids of the rounds matching every given condition: my card, the opponent card, the sign of value
+        (-1, 0 or 1) and the start of the move sequence (a list of cards and Nones as in StorageRow.sequence).
+        Costs the size of the matching posting lists, not of the history.
+        """
+        index = self.index
+        ids = None
+        if prefix is not None:
+            ids = index.prefixes.get(tuple(_CARD_CODES[card] for card in prefix))
+            ids = np.empty(0, dtype=np.int64) if ids is None else ids.values.copy()
+        if my_card is not None or opponent_card is not None or sign is not None or ids is None:
+            lists = [index.cards[key].values for key in self._card_keys(my_card, opponent_card, sign)]
+            card_ids = np.sort(np.concatenate(lists)) if lists else np.empty(0, dtype=np.int64)
+            ids = card_ids if ids is None else np.intersect1d(ids, card_ids, assume_unique=True)
+        return ids
+
+    def query_stats(self, my_card: Card = None, opponent_card: Card = None, sign: int = None,
+                    prefix=None) -> QueryStats:
+        """
+        Count, value sum and mean value of the rounds of query(). Answered from the kept sums
+        when only card and sign or only prefix conditions are given.
+        """
+        index = self.index
+        if prefix is None:
+            count, total = 0, 0.0
+            for key in self._card_keys(my_card, opponent_card, sign):
+                count += index.card_stats[key][0]
+                total += index.card_stats[key][1]
+        elif my_card is None and opponent_card is None and sign is None:
+            count, total = index.prefix_stats.get(tuple(_CARD_CODES[card] for card in prefix), (0, 0.0))
+        else:
+            ids = self.query(my_card, opponent_card, sign, prefix)
+            count, total = len(ids), float(self.value.values[ids].sum())
+        return QueryStats(count=count, total=total, mean=total / count if count else float("nan"))
+
+    def flush(self):
+        for name, _ in self.COLUMNS:
+            getattr(self, name).flush()
+
+    def close(self):
+        for name, _ in self.COLUMNS:
+            getattr(self, name).close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
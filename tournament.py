@@ -0,0 +1,115 @@
+import math
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from gym.wrappers import TimeLimit
+
+from bots import BOTS
+from env import CardsGuessing
+from seeding import SeedSequence, seed_all
+
+
+ShardResult = namedtuple("ShardResult", "player opponent shard episodes wins reward reward_squares steps")
+Cell = namedtuple("Cell", "episodes win_rate win_rate_ci mean_reward mean_reward_ci")
+
+
+def play_shard(player_name: str, opponent_name: str, shard: int, episodes: int,
+               starting_money: int, max_episode_steps: int, seed: int) -> ShardResult:
+    """
+    Plays episodes of player against opponent with fresh bots, the result depends only on the arguments.
+    Some pairings never move money (e.g. SmarterBaselineBot against itself), so episodes are cut at max_episode_steps
+    """
+    player = BOTS[player_name]()
+    opponent = BOTS[opponent_name]()
+    env = TimeLimit(CardsGuessing(starting_money, opponent), max_episode_steps=max_episode_steps)
+    player.set_env(env)
+    seed_all(seed, env, player, opponent)
+    result = player.run(episodes, render=False)
+    return ShardResult(player=player_name,
+                       opponent=opponent_name,
+                       shard=shard,
+                       episodes=result.episodes,
+                       wins=result.wins,
+                       reward=result.total_reward,
+                       reward_squares=sum(r * r for r in result.episode_rewards),
+                       steps=result.steps)
+
+
+def shard_arguments(names, episodes: int, shard_size: int, starting_money: int, max_episode_steps: int, seed: int):
+    """
+    Every ordered pairing of names split into shards of at most shard_size episodes, seeded by a hash of
+    the two names so a match plays the same whatever else is in the list and in which order
+    """
+    for player_name in names:
+        for opponent_name in names:
+            for shard, start in enumerate(range(0, episodes, shard_size)):
+                shard_seed = SeedSequence(seed, (player_name, opponent_name, shard)).seed
+                yield (player_name, opponent_name, shard, min(shard_size, episodes - start),
+                       starting_money, max_episode_steps, shard_seed)
+
+
+def run_shards(names, episodes: int, shard_size: int = 100, starting_money: int = 100,
+               max_episode_steps: int = 1000, seed: int = 0, max_workers: int = None):
+    """
+    Yields ShardResults as soon as workers finish them
+    """
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        futures = [executor.submit(play_shard, *arguments)
+                   for arguments in shard_arguments(names, episodes, shard_size, starting_money,
+                                                    max_episode_steps, seed)]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def _cell(shards, z: float) -> Cell:
+    # shards are merged in shard order so float sums do not depend on which worker finished first
+    shards = sorted(shards, key=lambda s: s.shard)
+    episodes = sum(s.episodes for s in shards)
+    win_rate = sum(s.wins for s in shards) / episodes
+    mean_reward = sum(s.reward for s in shards) / episodes
+    reward_variance = max(sum(s.reward_squares for s in shards) / episodes - mean_reward ** 2, 0.0)
+    return Cell(episodes=episodes,
+                win_rate=win_rate,
+                win_rate_ci=z * math.sqrt(win_rate * (1 - win_rate) / episodes),
+                mean_reward=mean_reward,
+                mean_reward_ci=z * math.sqrt(reward_variance / episodes))
+
+
+def tournament(names=None, episodes: int = 1000, shard_size: int = 100, starting_money: int = 100,
+               max_episode_steps: int = 1000, seed: int = 0, max_workers: int = None, z: float = 1.96,
+               on_shard=None):
+    """
+    Round robin of the registered bots. Returns {(player, opponent): Cell} with normal approximation
+    confidence intervals (z=1.96 for 95%), on_shard is called with every ShardResult as it arrives.
+    """
+    names = list(BOTS) if names is None else list(names)
+    shards = {}
+    for result in run_shards(names, episodes, shard_size, starting_money, max_episode_steps, seed, max_workers):
+        shards.setdefault((result.player, result.opponent), []).append(result)
+        if on_shard is not None:
+            on_shard(result)
+    return {pairing: _cell(pairing_shards, z) for pairing, pairing_shards in shards.items()}
+
+
+def format_matrix(names, cells, column: int = 26) -> str:
+    width = max(len(name) for name in names) + 2
+    lines = ["win rate / mean reward of the row bot playing against the column bot",
+             " " * width + "".join(name[:column - 2].rjust(column) for name in names)]
+    for player in names:
+        row = player.ljust(width)
+        for opponent in names:
+            c = cells[(player, opponent)]
+            row += f"{c.win_rate:.2f}±{c.win_rate_ci:.2f} {c.mean_reward:+.1f}±{c.mean_reward_ci:.1f}".rjust(column)
+        lines.append(row)
+    return "\n".join(lines)
+
+
+def main():
+    names = list(BOTS)
+    cells = tournament(names, episodes=200, shard_size=20)
+    print(format_matrix(names, cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+import multiprocessing
+import os
+import queue
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+import numpy as np
+from gym.wrappers import TimeLimit
+
+from bots import BOTS, SarsaBot
+from env import CardsGuessing, FirstTurnInRound
+from qtable import QTable
+from seeding import SeedSequence, seed_all
+from vector_env import VectorCardsGuessing
+
+
+CurvePoint = namedtuple("CurvePoint", "batch rounds episodes mean_round_reward win_rate seconds")
+
+
+def train(bot, opponent, batches: int = 100, num_envs: int = 1024, steps_per_batch: int = 16,
+          starting_money: int = 100, lam: float = 1.0, seed: int = None, on_batch=None) -> list:
+    """
+    Plays num_envs tables of VectorCardsGuessing at once with the bot's batched policy and updates its Q table
+    from every batch of rounds at once (bot.learn_batch). The opponent has to support observe_batch/act_batch.
+    Returns the learning curve, one CurvePoint per batch, on_batch is called with every point.
+    """
+    env = VectorCardsGuessing(num_envs, starting_money, opponent, seed)
+    bot.set_env(env)
+    observations = env.reset()
+    bot.observe_batch(observations, np.zeros(num_envs), np.zeros(num_envs, dtype=bool))
+    bot.learn_batch(lam)
+    episode_rewards = np.zeros(num_envs)
+    curve = []
+    start = time.time()
+    for batch in range(batches):
+        episodes = wins = 0
+        for _ in range(steps_per_batch):
+            observations, rewards, dones, _ = env.step(bot.act_batch(observations))
+            bot.observe_batch(observations, rewards, dones)
+            episode_rewards += rewards
+            episodes += int(dones.sum())
+            wins += int((episode_rewards[dones] > 0).sum())
+            episode_rewards[dones] = 0.0
+        rounds, reward = bot.learn_batch(lam)
+        point = CurvePoint(batch=batch,
+                           rounds=rounds,
+                           episodes=episodes,
+                           mean_round_reward=reward / rounds if rounds else 0.0,
+                           win_rate=wins / episodes if episodes else float("nan"),
+                           seconds=time.time() - start)
+        curve.append(point)
+        if on_batch is not None:
+            on_batch(point)
+    return curve
+
+
+def train_from_trajectories(bot, trajectories, rounds_per_batch: int = 10000, lam: float = 1.0) -> list:
+    """
+    Learns from recorder.Trajectories of a player as if the bot had played the recorded cards,
+    updating the Q table every rounds_per_batch rounds. Returns the learning curve of the recorded play.
+    """
+    curve = []
+    start = time.time()
+    rounds = 0
+    previous = None
+    for observation, action, reward, done in trajectories.data:
+        observation = observation[np.newaxis]
+        if action >= 0:
+            bot.replay_batch(previous, [action])
+        bot.observe_batch(observation, [reward], [done])
+        previous = observation
+        rounds += observation[0, 0] == FirstTurnInRound.YES
+        if rounds >= rounds_per_batch:
+            rounds = 0
+            _learn_point(bot, lam, curve, start)
+    _learn_point(bot, lam, curve, start)
+    return curve
+
+
+def _learn_point(bot, lam, curve, start):
+    rounds, reward = bot.learn_batch(lam)
+    if rounds:
+        curve.append(CurvePoint(batch=len(curve), rounds=rounds, episodes=0, mean_round_reward=reward / rounds,
+                                win_rate=float("nan"), seconds=time.time() - start))
+
+
+def _train_one(opponent_name: str, discount: float, alpha: float, explorer_spirit_level: float, seed: int,
+               kwargs: dict) -> list:
+    player_seed, opponent_seed, env_seed = SeedSequence(seed).spawn(3)
+    bot = SarsaBot(discount, alpha, explorer_spirit_level)
+    bot.seed(player_seed.seed)
+    opponent = BOTS[opponent_name]()
+    opponent.seed(opponent_seed.seed)
+    return train(bot, opponent, seed=env_seed.seed, **kwargs)
+
+
+def sweep(opponent_name: str, discounts=(0.9,), alphas=(0.1,), explorer_spirit_levels=(0.05,), seed: int = 0,
+          max_workers: int = None, **kwargs) -> dict:
+    """
+    Trains a fresh SarsaBot against the named opponent for every combination of hyperparameters in parallel,
+    returns {(discount, alpha, explorer_spirit_level): learning curve}, kwargs go to train
+    """
+    grid = list(product(discounts, alphas, explorer_spirit_levels))
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        futures = {parameters: executor.submit(_train_one, opponent_name, *parameters,
+                                               SeedSequence(seed, (i,)).seed, kwargs)
+                   for i, parameters in enumerate(grid)}
+        return {parameters: future.result() for parameters, future in futures.items()}
+
+
+class _SharedQTable(QTable):
+    """
+    QTable over arrays in shared memory of a fixed capacity, only the learner writes to it
+    """
+    def __init__(self, buffers, events: int = 4, actions: int = 2):
+        self.events = events
+        self.actions = actions
+        self.size = 1
+        self.transitions, self.parent, self.event, self.values = _shared_views(buffers, events, actions)
+
+    def _grow(self) -> None:
+        raise MemoryError("shared Q table is full, train_parallel needs a larger capacity")
+
+
+def _shared_buffers(capacity: int, events: int = 4, actions: int = 2):
+    buffers = (multiprocessing.RawArray("q", capacity * events), multiprocessing.RawArray("q", capacity),
+               multiprocessing.RawArray("q", capacity), multiprocessing.RawArray("d", capacity * actions))
+    transitions, parent, event, _ = _shared_views(buffers, events, actions)
+    transitions.fill(-1)
+    parent.fill(-1)
+    event.fill(-1)
+    return buffers
+
+
+def _shared_views(buffers, events: int, actions: int):
+    transitions, parent, event, values = (np.frombuffer(buffer, dtype=dtype)
+                                          for buffer, dtype in zip(buffers, (np.int64, np.int64, np.int64, np.float64)))
+    return transitions.reshape(-1, events), parent, event, values.reshape(-1, actions)
+
+
+class _ActorTable(object):
+    """
+    Stands in for the QTable of an actor's SarsaBot: states are depths in the events of the current round,
+    looked up in the shared table without interning, unknown states are worth 0. Instead of updating,
+    finished rounds are sent to the learner in chunks of flush_rounds.
+    """
+    ROOT = QTable.ROOT
+
+    def __init__(self, buffers, output, flush_rounds: int, events: int = 4, actions: int = 2):
+        self.actions = actions
+        self._transitions, _, _, self._values = _shared_views(buffers, events, actions)
+        self._output = output
+        self._flush_rounds = flush_rounds
+        self._events = []
+        self._ids = [QTable.ROOT]
+        self._rounds = []
+
+    def next(self, state: int, event: int) -> int:
+        del self._events[state:]
+        del self._ids[state + 1:]
+        shared = self._ids[state]
+        self._events.append(event)
+        self._ids.append(int(self._transitions[shared, event]) if shared >= 0 else -1)
+        return state + 1
+
+    def greedy(self, state: int) -> int:
+        shared = self._ids[state]
+        if shared < 0:
+            return self.actions - 1  # ties go to the last action
+        return max(zip(self._values[shared].tolist(), range(self.actions)))[1]
+
+    def update(self, states, actions, reward: float, alpha: float, discount: float) -> None:
+        if states:
+            self._rounds.append((tuple(self._events), tuple(states), tuple(actions), reward))
+            if len(self._rounds) >= self._flush_rounds:
+                self.flush()
+
+    def flush(self) -> None:
+        if self._rounds:
+            self._output.put(self._rounds)
+            self._rounds = []
+
+
+def _actor(buffers, output, stop, opponent_name: str, discount: float, alpha: float, explorer_spirit_level: float,
+           starting_money: int, max_episode_steps: int, flush_rounds: int, seed: int) -> None:
+    bot = SarsaBot(discount, alpha, explorer_spirit_level)
+    table = bot._q_table = _ActorTable(buffers, output, flush_rounds)
+    opponent = BOTS[opponent_name]()
+    env = TimeLimit(CardsGuessing(starting_money, opponent), max_episode_steps=max_episode_steps)
+    bot.set_env(env)
+    seed_all(seed, env, bot, opponent)
+    while not stop.is_set():
+        bot.run(10, render=False)
+    table.flush()
+
+
+def _learn_rounds(table: QTable, rounds, alpha: float, discount: float, lam: float) -> float:
+    # interns the events of every round and applies all their updates at once in the order they came
+    states, actions, round_index, rewards = [], [], [], []
+    for i, (events, depths, round_actions, reward) in enumerate(rounds):
+        ids = [table.ROOT]
+        for event in events:
+            ids.append(table.next(ids[-1], event))
+        states.extend(ids[depth] for depth in depths)
+        actions.extend(round_actions)
+        round_index.extend([i] * len(depths))
+        rewards.append(reward)
+    states, actions = np.array(states, dtype=np.int64), np.array(actions, dtype=np.int64)
+    rewards = np.array(rewards, dtype=np.float64)
+    targets = table.lambda_returns(states, np.array(round_index, dtype=np.int64), rewards, discount, lam)
+    table.update_batch(states, actions, targets, alpha)
+    return float(rewards.sum())
+
+
+def train_parallel(opponent_name: str, rounds: int = 1000000, workers: int = None, discount: float = 0.9,
+                   alpha: float = 0.1, explorer_spirit_level: float = 0.05, lam: float = 1.0,
+                   batch_rounds: int = 10000, flush_rounds: int = 500, capacity: int = 1 << 20,
+                   starting_money: int = 100, max_episode_steps: int = 1000, seed: int = 0, on_batch=None):
+    """
+    Actor/learner training of a SarsaBot against the named opponent. Every worker process plays CardsGuessing
+    with a SarsaBot acting epsilon-greedily from the Q table in shared memory and sends its finished rounds
+    through a queue, this process learns from them in batches of batch_rounds (see SarsaBot.learn_batch).
+    Actors act on a Q table at most one batch old. Returns the trained SarsaBot with a private copy of the table
+    and the learning curve (one CurvePoint per batch, episodes and win rate are not tracked).
+    """
+    workers = workers or os.cpu_count()
+    buffers = _shared_buffers(capacity)
+    table = _SharedQTable(buffers)
+    output = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    processes = [multiprocessing.Process(target=_actor, args=(buffers, output, stop, opponent_name, discount, alpha,
+                                                               explorer_spirit_level, starting_money,
+                                                               max_episode_steps, flush_rounds,
+                                                               SeedSequence(seed, (i,)).seed), daemon=True)
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+
+    curve = []
+    start = time.time()
+    learned = 0
+    batch = []
+    try:
+        while learned < rounds:
+            batch.extend(output.get())
+            if len(batch) >= min(batch_rounds, rounds - learned):
+                reward = _learn_rounds(table, batch, alpha, discount, lam)
+                learned += len(batch)
+                point = CurvePoint(batch=len(curve), rounds=len(batch), episodes=0,
+                                   mean_round_reward=reward / len(batch), win_rate=float("nan"),
+                                   seconds=time.time() - start)
+                curve.append(point)
+                if on_batch is not None:
+                    on_batch(point)
+                batch = []
+    finally:
+        stop.set()
+        # actors can only exit once the queue they fed is drained
+        while any(process.is_alive() for process in processes):
+            try:
+                output.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for process in processes:
+            process.join()
+
+    bot = SarsaBot(discount, alpha, explorer_spirit_level)
+    bot._q_table = QTable(table.events, table.actions, capacity=len(table))
+    for name in ("transitions", "parent", "event", "values"):
+        getattr(bot._q_table, name)[:len(table)] = getattr(table, name)[:len(table)]
+    bot._q_table.size = len(table)
+    return bot, curve
+
+
+def main():
+    curves = sweep("SmarterBaselineBot", discounts=(0.5, 0.9), alphas=(0.01, 0.1), explorer_spirit_levels=(0.05,),
+                   batches=50)
+    for parameters, curve in sorted(curves.items()):
+        last = curve[-10:]
+        print("discount %s alpha %s explorer %s: mean round reward %.3f, win rate %.3f" % (
+            parameters + (np.mean([p.mean_round_reward for p in last]), np.nanmean([p.win_rate for p in last]))))
+
+
+if __name__ == "__main__":
+    main()
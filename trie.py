@@ -0,0 +1,208 @@
+import heapq
+import math
+
+import numpy as np
+
+import checkpoint
+
+
+class PrefixTrie(object):
+    """
+    Value sums and counts of move sequences stored as a trie of integer nodes, a sequence and all its
+    prefixes share one path. Bots keep the node of the moves made so far and step to a child per move.
+
+    With max_nodes the trie is trimmed on tick() to 90% of it, evicting the leaves of the lowest (decayed) count
+    and then the least recently updated first. With decay < 1 statistics lose that share of their weight
+    every tick(), so recent rounds count more. Decay is applied lazily when a node is touched.
+    Eviction candidates are kept in a heap: decay scales every count alike, so the order of two leaves only
+    changes when one of them is updated, which pushes a new entry and leaves the old one stale.
+    Inner nodes are pushed when they become leaves.
+    """
+    ROOT = 0
+
+    def __init__(self, max_nodes: int = None, decay: float = 1.0):
+        self.max_nodes = max_nodes
+        self.decay = decay
+        self.time = 0
+        self.children = [{}]  # node -> {symbol: child node}, None for freed nodes
+        self.parent = [None]
+        self.symbol = [None]
+        self.total = [0.0]
+        self.count = [0]
+        self.stamp = [0]  # time of the last update
+        self._free = []
+        self._leaves = []  # heap of (_eviction_key, stamp, node), stale entries are skipped when popped
+
+    def __len__(self):
+        return len(self.children) - len(self._free)
+
+    def child(self, node: int, symbol):
+        """
+        Child of node by symbol, None if node is None or it has no such child
+        """
+        if node is None:
+            return None
+        return self.children[node].get(symbol)
+
+    def add_child(self, node: int, symbol) -> int:
+        child = self.children[node].get(symbol)
+        if child is None:
+            if self._free:
+                child = self._free.pop()
+                self.children[child] = {}
+                self.parent[child] = node
+                self.symbol[child] = symbol
+                self.total[child] = 0.0
+                self.count[child] = 0
+                self.stamp[child] = self.time
+            else:
+                child = len(self.children)
+                self.children.append({})
+                self.parent.append(node)
+                self.symbol.append(symbol)
+                self.total.append(0.0)
+                self.count.append(0)
+                self.stamp.append(self.time)
+            self.children[node][symbol] = child
+            self._push(child)
+        return child
+
+    def _weight(self, node: int) -> float:
+        # share of its statistics node keeps at the current time
+        return 1.0 if self.decay == 1.0 else self.decay ** (self.time - self.stamp[node])
+
+    def _decayed(self, node: int) -> (float, float):
+        # without decay counts stay integers
+        if self.decay == 1.0:
+            return self.total[node], self.count[node]
+        weight = self._weight(node)
+        return self.total[node] * weight, self.count[node] * weight
+
+    def add(self, node: int, value: float) -> None:
+        total, count = self._decayed(node)
+        self.total[node] = total + value
+        self.count[node] = count + 1
+        self.stamp[node] = self.time
+        if not self.children[node]:
+            self._push(node)
+
+    def _eviction_key(self, node: int) -> float:
+        # the decayed count at time 0, in logs: the decayed count at any time divided by the same decay ** time
+        count = self.count[node]
+        if self.decay == 1.0:
+            return count
+        return (math.log(count) if count > 0 else -math.inf) - self.stamp[node] * math.log(self.decay)
+
+    def _push(self, node: int) -> None:
+        if self.max_nodes is None:
+            return
+        leaves = self._leaves
+        if len(leaves) > 2 * len(self.children) + 16:
+            # mostly stale, rebuilt from the leaves
+            self._leaves = [(self._eviction_key(leaf), self.stamp[leaf], leaf)
+                            for leaf, children in enumerate(self.children)
+                            if children is not None and not children and leaf != self.ROOT]
+            heapq.heapify(self._leaves)
+            leaves = self._leaves
+        heapq.heappush(leaves, (self._eviction_key(node), self.stamp[node], node))
+
+    def tick(self) -> None:
+        """
+        Advances the clock of decay and trims the trie to the memory budget, bots call it after every round
+        """
+        self.time += 1
+        if self.max_nodes is not None and len(self) > self.max_nodes:
+            self._evict(self.max_nodes - self.max_nodes // 10)
+
+    def _evict(self, size: int) -> None:
+        excess = len(self) - size
+        while excess > 0 and self._leaves:
+            key, stamp, node = heapq.heappop(self._leaves)
+            children = self.children[node]
+            if children is None or children or stamp != self.stamp[node] or key != self._eviction_key(node):
+                continue
+            parent = self.parent[node]
+            del self.children[parent][self.symbol[node]]
+            self.children[node] = None
+            self.parent[node] = None
+            self._free.append(node)
+            excess -= 1
+            if not self.children[parent] and parent != self.ROOT:
+                self._push(parent)
+
+    def mean(self, node: int) -> float:
+        """
+        Mean value of node, 0 for unknown sequences
+        """
+        if node is None or not self.count[node]:
+            return 0.0
+        return self.total[node] / self.count[node]
+
+    def find(self, key) -> int:
+        node = self.ROOT
+        for symbol in key:
+            node = self.child(node, symbol)
+        return node
+
+    def key(self, node: int) -> tuple:
+        key = []
+        while node != self.ROOT:
+            key.append(self.symbol[node])
+            node = self.parent[node]
+        return tuple(reversed(key))
+
+    def get(self, key, default=None):
+        """
+        (sum, count) of a sequence like the dict of tuples this replaces, decayed to the current time
+        """
+        node = self.find(key)
+        if node is None or not self.count[node]:
+            return default
+        return self._decayed(node)
+
+    def save(self, path: str, symbols, **attributes) -> None:
+        """
+        symbols lists every symbol of the sequences, they are stored as their index in it
+        """
+        codes = {symbol: code for code, symbol in enumerate(symbols)}
+        live = [children is not None for children in self.children]
+        checkpoint.save(path, "PrefixTrie",
+                        {"parent": np.array([-1 if p is None else p for p in self.parent], dtype=np.int64),
+                         "symbol": np.array([codes[s] if l and n != self.ROOT else -1
+                                             for n, (s, l) in enumerate(zip(self.symbol, live))], dtype=np.int8),
+                         "live": np.array(live, dtype=bool),
+                         "total": np.array(self.total, dtype=np.float64),
+                         "count": np.array(self.count, dtype=np.float64),
+                         "stamp": np.array(self.stamp, dtype=np.int64)},
+                        max_nodes=self.max_nodes, decay=self.decay, time=self.time, **attributes)
+
+    @classmethod
+    def from_checkpoint(cls, saved, symbols) -> "PrefixTrie":
+        attributes = saved.attributes
+        trie = cls(attributes["max_nodes"], attributes["decay"])
+        trie.time = attributes["time"]
+        arrays = saved.arrays
+        live = arrays["live"].tolist()
+        trie.parent = [p if l and p >= 0 else None for p, l in zip(arrays["parent"].tolist(), live)]
+        trie.symbol = [symbols[s] if s >= 0 else None for s in arrays["symbol"].tolist()]
+        trie.total = arrays["total"].tolist()
+        trie.count = [int(c) if c.is_integer() else c for c in arrays["count"].tolist()]
+        trie.stamp = arrays["stamp"].tolist()
+        trie.children = [{} if l else None for l in live]
+        trie._free = [node for node, l in enumerate(live) if not l]
+        for node, parent in enumerate(trie.parent):
+            if parent is not None:
+                trie.children[parent][trie.symbol[node]] = node
+        for node, children in enumerate(trie.children):
+            if children is not None and not children and node != trie.ROOT:
+                trie._push(node)
+        return trie
+
+    @classmethod
+    def load(cls, path: str, symbols) -> "PrefixTrie":
+        return cls.from_checkpoint(checkpoint.load(path, "PrefixTrie"), symbols)
+
+    def items(self):
+        for node, children in enumerate(self.children):
+            if children is not None and self.count[node]:
+                yield self.key(node), self._decayed(node)
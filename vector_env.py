@@ -0,0 +1,146 @@
+import numpy as np
+
+from seeding import np_random
+from env import Card, Guess, Player, FirstTurnInRound, RoundPhase, CardsGuessing, ROUND_KERNEL
+
+
+# ordered (player card, opponent card) pairs of random.sample(RED, RED, BLACK, BLACK, 2)
+_DEALS = np.array([(a, b) for i, a in enumerate((Card.RED, Card.RED, Card.BLACK, Card.BLACK))
+                   for j, b in enumerate((Card.RED, Card.RED, Card.BLACK, Card.BLACK)) if i != j], dtype=np.int8)
+
+_NEXT_STATE = np.array(ROUND_KERNEL.next_state, dtype=np.int64)
+_PHASE = ROUND_KERNEL.array(lambda state: state.phase, dtype=np.int8)
+_SAID = ROUND_KERNEL.array(lambda state: state.said, dtype=np.int8)
+_PLAYER_PAYOFF = np.array([0.0 if payoff is None else payoff[Player.PLAYER] for payoff in ROUND_KERNEL.payoff])
+_INITIAL = np.zeros((2, 2, 2), dtype=np.int64)
+for (player_card, opponent_card, starting_player), initial_state in ROUND_KERNEL.initial.items():
+    _INITIAL[player_card, opponent_card, starting_player] = initial_state
+
+
+class VectorCardsGuessing(object):
+    """
+    N independent CardsGuessing tables stepped at once.
+
+    The state of every table lives in numpy arrays, indexed [table] or [table, Player]:
+    cards, money, starting player, wins and the ROUND_KERNEL state of the round, which stands for
+    the step histories, so rules and rewards are the same table lookups CardsGuessing does.
+
+    The opponent plays all tables together, so it has to support Bot.observe_batch / Bot.act_batch.
+    Finished episodes are reset automatically, the observation of a finished table is the first one
+    of its next episode, the last observation of the finished episode is in info["terminal_observations"].
+    """
+    _player = Player.PLAYER
+    _opponent = Player.OPPONENT
+
+    action_space = CardsGuessing.action_space
+    observation_space = CardsGuessing.observation_space
+
+    def __init__(self, num_envs: int, starting_money, opponent, seed=None):
+        self.num_envs = num_envs
+        self._starting_money = starting_money
+        self._opponent_agent = opponent
+        self._random = np_random(seed)
+
+        self._card = np.zeros((num_envs, 2), dtype=np.int8)
+        self._money = np.zeros((num_envs, 2), dtype=np.float64)
+        self._round_state = np.zeros(num_envs, dtype=np.int64)
+        self._starting_player = np.zeros(num_envs, dtype=np.int8)
+        self._wins = np.zeros((num_envs, 2), dtype=np.int64)
+
+        opponent.set_env(self)
+
+    def seed(self, seed=None):
+        self._random = np_random(seed)
+        return [seed]
+
+    def _deal(self, tables):
+        return _DEALS[self._random.randint(len(_DEALS), size=len(tables))], \
+               self._random.randint(2, size=len(tables))
+
+    def _start_new_round(self, tables, player_money, opponent_money):
+        cards, starting_player = self._deal(tables)
+        self._card[tables] = cards
+        self._money[tables, self._player] = player_money
+        self._money[tables, self._opponent] = opponent_money
+        self._starting_player[tables] = starting_player
+        self._round_state[tables] = _INITIAL[cards[:, self._player], cards[:, self._opponent], starting_player]
+
+    def _get_observations(self, tables, player: Player, first_turn: bool, previous_cards=None):
+        other = self._opponent if player == self._player else self._player
+        observations = np.empty((len(tables), 4), dtype=np.int8)
+        observations[:, 0] = FirstTurnInRound(int(first_turn))
+        observations[:, 1] = self._card[tables, player]
+        observations[:, 2] = _SAID[self._round_state[tables], other]
+        observations[:, 3] = Guess.AWAITING_FOR_GUESS if previous_cards is None else previous_cards[:, player]
+        return observations
+
+    def _make_move(self, tables, actions):
+        self._round_state[tables] = _NEXT_STATE[self._round_state[tables], actions]
+
+    def _make_opponents_turn(self, tables, rewards, first_turn: bool, previous_cards=None):
+        if len(tables) == 0:
+            return
+        observations = self._get_observations(tables, self._opponent, first_turn, previous_cards)
+        self._opponent_agent.observe_batch(observations, rewards, np.zeros(len(tables), dtype=bool), tables)
+        actions = np.asarray(self._opponent_agent.act_batch(observations, tables), dtype=np.int8)
+        self._make_move(tables, actions)
+
+    def _finish_round(self, tables):
+        player_rewards = _PLAYER_PAYOFF[self._round_state[tables]]
+        rewards = np.stack([player_rewards, -player_rewards], axis=1)
+        money = self._money[tables] + rewards
+        self._wins[tables, self._opponent] += money[:, self._player] < 10
+        self._wins[tables, self._player] += money[:, self._opponent] < 10
+        previous_cards = self._card[tables, ::-1].copy()
+        self._start_new_round(tables, money[:, self._player], money[:, self._opponent])
+        return rewards, previous_cards
+
+    def _make_first_turn_in_round(self, tables, rewards, previous_cards):
+        done = (self._money[tables] < 10).any(axis=1)
+
+        finished = tables[done]
+        if len(finished) > 0:
+            observations = self._get_observations(finished, self._opponent, True, previous_cards[done])
+            self._opponent_agent.observe_batch(observations, rewards[done, self._opponent],
+                                               np.ones(len(finished), dtype=bool), finished)
+
+        opponent_starts = ~done & (self._starting_player[tables] == self._opponent)
+        self._make_opponents_turn(tables[opponent_starts], rewards[opponent_starts, self._opponent],
+                                  first_turn=True, previous_cards=previous_cards[opponent_starts])
+
+        return self._get_observations(tables, self._player, True, previous_cards), rewards[:, self._player], done
+
+    def _reset(self, tables):
+        self._start_new_round(tables, self._starting_money, self._starting_money)
+        rewards = np.zeros((len(tables), 2), dtype=np.float64)
+        previous_cards = np.full((len(tables), 2), Guess.AWAITING_FOR_GUESS, dtype=np.int8)
+        return self._make_first_turn_in_round(tables, rewards, previous_cards)[0]
+
+    def reset(self):
+        return self._reset(np.arange(self.num_envs))
+
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=np.int8)
+        assert actions.shape == (self.num_envs,), actions.shape
+        assert not (self._money < 10).any()
+        tables = np.arange(self.num_envs)
+        self._make_move(tables, actions)
+
+        phase = _PHASE[self._round_state]
+        opponent_moves = tables[(phase == RoundPhase.OPPONENT) | (phase == RoundPhase.OPPONENT_LAST)]
+        self._make_opponents_turn(opponent_moves, np.zeros(len(opponent_moves)), first_turn=False)
+
+        observations = self._get_observations(tables, self._player, False)
+        rewards = np.zeros(self.num_envs, dtype=np.float64)
+        dones = np.zeros(self.num_envs, dtype=bool)
+
+        finished = tables[(phase == RoundPhase.OPPONENT_LAST) | (phase == RoundPhase.FINISHED)]
+        if len(finished) > 0:
+            round_rewards, previous_cards = self._finish_round(finished)
+            observations[finished], rewards[finished], dones[finished] = \
+                self._make_first_turn_in_round(finished, round_rewards, previous_cards)
+
+        terminal_observations = observations[dones].copy()
+        if dones.any():
+            observations[dones] = self._reset(tables[dones])
+        return observations, rewards, dones, {"terminal_observations": terminal_observations}